@@ -0,0 +1,177 @@
+# Анализ всей истории работы техники на NumPy: загрузка, средние, процентили, простои.
+# Нужен только для обработки больших журналов на компьютере или сервере,
+# приложению на телефоне NumPy не требуется.
+# Запуск: python analytics.py <папка с data.db или data.json> [sqlite|journal|binary]
+# Данные только читаются: хранилище не создается и не переносится.
+import sys
+from datetime import datetime
+import numpy as np
+from storage import open_storage
+
+
+def date_ordinal(date, cache):
+    """Номер дня (proleptic Gregorian) для даты "ГГГГ-ММ-ДД", одинаковые даты разбираются один раз."""
+    ordinal = cache.get(date)
+    if ordinal is None:
+        ordinal = cache[date] = datetime.strptime(date, "%Y-%m-%d").toordinal()
+    return ordinal
+
+
+class NoteColumns:
+    """Снимок всех заметок в виде столбцов NumPy.
+
+    technique_codes[i] - номер техники в techniques, days[i] - номер дня,
+    minutes[i] - время работы в минутах, ids[i] - id заметки.
+    """
+
+    def __init__(self, techniques, technique_codes, days, minutes, ids):
+        self.techniques = techniques
+        self.technique_codes = technique_codes
+        self.days = days
+        self.minutes = minutes
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_ledger(cls, ledger):
+        """Столбцы из хранилища Ledger."""
+        return cls.from_storage(ledger.storage, ledger.techniques)
+
+    @classmethod
+    def from_storage(cls, storage, techniques=None):
+        """Столбцы из хранилища, заметки читаются по одной."""
+        if techniques is None:
+            techniques = storage.load_index()["techniques"]  # Журнал здесь же загружается целиком
+        size = storage.count_notes()
+        techniques = list(techniques)
+        codes = {technique: code for code, technique in enumerate(techniques)}
+        technique_codes = np.empty(size, dtype=np.int32)
+        days = np.empty(size, dtype=np.int32)
+        minutes = np.empty(size, dtype=np.int32)
+        ids = np.empty(size, dtype=np.int64)
+        cache = {}
+        count = 0
+        for technique, note in storage.iter_notes():
+            if technique not in codes:
+                codes[technique] = len(techniques)
+                techniques.append(technique)
+            try:
+                day = date_ordinal(note["date"], cache)
+            except ValueError:
+                continue  # Заметка с испорченной датой в анализ не попадает
+            technique_codes[count] = codes[technique]
+            days[count] = day
+            minutes[count] = note["work_time"] // 60
+            ids[count] = note["id"]
+            count += 1
+        return cls(techniques, technique_codes[:count], days[:count], minutes[:count], ids[:count])
+
+    def select(self, date_from=None, date_to=None):
+        """Столбцы за период (даты "ГГГГ-ММ-ДД" включительно)."""
+        mask = np.ones(len(self), dtype=bool)
+        if date_from:
+            mask &= self.days >= datetime.strptime(date_from, "%Y-%m-%d").toordinal()
+        if date_to:
+            mask &= self.days <= datetime.strptime(date_to, "%Y-%m-%d").toordinal()
+        return NoteColumns(
+            self.techniques, self.technique_codes[mask], self.days[mask], self.minutes[mask], self.ids[mask]
+        )
+
+    def _per_technique(self, values):
+        """Значения по технике: {техника: значение}, техника без заметок пропускается."""
+        counts = np.bincount(self.technique_codes, minlength=len(self.techniques))
+        values = values.tolist()  # Обычные числа Python вместо скаляров NumPy
+        return {
+            technique: values[code]
+            for code, technique in enumerate(self.techniques)
+            if counts[code]
+        }
+
+    def total_minutes(self):
+        """Время работы по технике, минуты."""
+        sums = np.bincount(self.technique_codes, weights=self.minutes, minlength=len(self.techniques))
+        return self._per_technique(sums.astype(np.int64))
+
+    def session_counts(self):
+        """Число заметок (сеансов работы) по технике."""
+        return self._per_technique(np.bincount(self.technique_codes, minlength=len(self.techniques)))
+
+    def average_session(self):
+        """Средняя длительность сеанса по технике, минуты."""
+        counts = np.bincount(self.technique_codes, minlength=len(self.techniques))
+        sums = np.bincount(self.technique_codes, weights=self.minutes, minlength=len(self.techniques))
+        return self._per_technique(sums / np.maximum(counts, 1))
+
+    def _groups(self, values):
+        """values, разбитые по технике: {техника: массив}."""
+        order = np.argsort(self.technique_codes, kind="stable")
+        codes = self.technique_codes[order]
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        return {
+            self.techniques[group_codes[0]]: group
+            for group_codes, group in zip(np.split(codes, bounds), np.split(values[order], bounds))
+            if len(group)
+        }
+
+    def session_percentiles(self, percentiles=(50, 90, 99)):
+        """Процентили длительности сеанса по технике: {техника: {процентиль: минуты}}."""
+        return {
+            technique: dict(zip(percentiles, np.percentile(minutes, percentiles).tolist()))
+            for technique, minutes in self._groups(self.minutes).items()
+        }
+
+    def idle_gaps(self):
+        """Простои между рабочими днями по технике: {техника: (средний, наибольший)} в днях.
+
+        Простой - число дней без работы между двумя соседними рабочими днями.
+        """
+        result = {}
+        for technique, days in self._groups(self.days).items():
+            work_days = np.unique(days)
+            gaps = np.diff(work_days) - 1
+            result[technique] = (float(gaps.mean()), int(gaps.max())) if len(gaps) else (0.0, 0)
+        return result
+
+    def utilisation(self, hours_per_day=24):
+        """Загрузка техники: доля рабочего времени от hours_per_day за каждый день наблюдений.
+
+        Период наблюдений - от первого до последнего дня в столбцах.
+        """
+        if not len(self):
+            return {}
+        days = int(self.days.max() - self.days.min()) + 1
+        available = days * hours_per_day * 60
+        return {technique: minutes / available for technique, minutes in self.total_minutes().items()}
+
+
+def main():
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "."
+    storage_kind = sys.argv[2] if len(sys.argv) > 2 else "sqlite"
+    try:
+        storage = open_storage(data_dir, storage_kind, read_only=True)
+    except FileNotFoundError as error:
+        sys.exit(str(error))
+    columns = NoteColumns.from_storage(storage)
+    storage.close()
+    print(f"Заметок: {len(columns)}")
+    sessions = columns.session_counts()
+    totals = columns.total_minutes()
+    averages = columns.average_session()
+    percentiles = columns.session_percentiles()
+    gaps = columns.idle_gaps()
+    utilisation = columns.utilisation()
+    for technique in totals:
+        p50, p90, p99 = percentiles[technique].values()
+        mean_gap, max_gap = gaps[technique]
+        print(
+            f"{technique}: сеансов {sessions[technique]}, всего {totals[technique] / 60:.1f} ч, "
+            f"средний сеанс {averages[technique]:.0f} мин (p50 {p50:.0f}, p90 {p90:.0f}, p99 {p99:.0f}), "
+            f"простой в среднем {mean_gap:.1f} дн (наибольший {max_gap}), "
+            f"загрузка {utilisation[technique]:.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# Замеры скорости и памяти: загрузка, сохранение, список заметок, итоги, экспорт/импорт.
+# Запуск: python bench.py --sizes 10000 100000 1000000 --output bench_results.json
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from ledger import Ledger, Note
+
+SIZES = (10000, 100000, 1000000)
+STORAGES = ("sqlite", "journal", "binary")
+DEFAULT_TECHNIQUES = ["Champion", "велосипед", "мангал", "еще техника"]
+DESCRIPTIONS = [
+    "", "ремонт", "замена масла", "покос травы", "перевозка груза",
+    "уборка территории", "заправка", "проверка двигателя", "работа на участке",
+]
+
+
+def load_technique_names(path="techniques.txt"):
+    """Названия техники из techniques.txt, если он есть."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            names = [line.strip() for line in file if line.strip()]
+        if names:
+            return names
+    return list(DEFAULT_TECHNIQUES)
+
+
+def generate_history(size, techniques, seed=0):
+    """Синтетическая история из size заметок в формате data.json."""
+    rng = random.Random(seed)
+    start = date(2020, 1, 1).toordinal()
+    days = 365 * 5
+    data = {"techniques": list(techniques), "notes": {technique: [] for technique in techniques}}
+    for _ in range(size):
+        technique = rng.choice(techniques)
+        data["notes"][technique].append({
+            "date": date.fromordinal(start + rng.randrange(days)).isoformat(),
+            "description": f"{rng.choice(DESCRIPTIONS)} {rng.randrange(100)}".strip(),
+            "work_time": rng.randrange(1, 12 * 60) * 60,
+        })
+    return data
+
+
+def measure(results, name, func, repeat=1):
+    """Время (среднее на вызов) и пиковая память операции."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        value = func()
+    elapsed = (time.perf_counter() - started) / repeat
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results[name] = {"seconds": round(elapsed, 6), "peak_bytes": peak}
+    print(f"    {name:<16} {elapsed * 1000:10.2f} мс {peak / 1048576:10.2f} МБ")
+    return value
+
+
+def note_rows():
+    """Построение строк списка заметок так же, как это делает MainApp."""
+    os.environ.setdefault("KIVY_NO_ARGS", "1")  # Аргументы командной строки - для bench.py, а не для Kivy
+    try:
+        from main_6 import MainApp
+    except ImportError:
+        return None  # Без Kivy список заметок не замерить
+    app = MainApp()
+    return lambda notes: [app.note_row(note) for note in notes]
+
+
+def run_case(size, storage_kind, techniques, rows):
+    """Все замеры для одного размера истории и одного хранилища."""
+    results = {}
+    data = generate_history(size, techniques)
+    biggest = max(techniques, key=lambda technique: len(data["notes"][technique]))
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    empty_dir = tempfile.mkdtemp(prefix="bench_legacy_")  # Без старых .txt для переноса
+    try:
+        ledger = Ledger(work_dir, storage_kind, legacy_dir=empty_dir)
+        measure(results, "save_full", lambda: ledger.storage.replace(data))
+        ledger.close()
+        del data
+
+        ledger = measure(results, "load", lambda: Ledger(work_dir, storage_kind, legacy_dir=empty_dir))
+        notes = measure(results, "load_technique", lambda: ledger.technique_notes(biggest))
+        if rows:
+            measure(results, "render", lambda: rows(notes))
+        measure(results, "aggregate", lambda: ledger.totals_by("month"))
+        measure(
+            results, "save_one",
+            lambda: ledger.add_note(biggest, Note("2025-03-01", "замер", timedelta(minutes=30))),
+            repeat=100
+        )
+        export_path = os.path.join(work_dir, "export.jsonl")
+        measure(results, "export", lambda: ledger.export_file(export_path))
+        measure(results, "import", lambda: ledger.import_file(export_path))
+        ledger.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        shutil.rmtree(empty_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности учета работы техники")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="Количество заметок")
+    parser.add_argument("--storage", nargs="+", default=list(STORAGES), choices=STORAGES)
+    parser.add_argument("--output", default="bench_results.json", help="Файл для результатов JSON")
+    args = parser.parse_args()
+
+    techniques = load_technique_names()
+    rows = note_rows()
+    report = {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "results": []}
+    for size in args.sizes:
+        for storage_kind in args.storage:
+            print(f"{storage_kind}, заметок: {size}")
+            report["results"].append({
+                "size": size,
+                "storage": storage_kind,
+                "operations": run_case(size, storage_kind, techniques, rows),
+            })
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=4)
+    print(f"Результаты записаны в файл: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,493 @@
+# Учет работы техники без интерфейса.
+# MainApp (main_6.py) только отображает данные Ledger, поэтому тот же код
+# можно запускать на сервере для обработки больших журналов и для замеров.
+from datetime import timedelta
+from collections import OrderedDict
+from bisect import bisect_left, insort
+from sys import intern
+from contextlib import contextmanager
+from itertools import islice
+import csv
+import json
+import os
+from storage import open_storage, migrate, atomic_open, read_json, iter_data_notes
+from totals import TechniqueTotals
+from search import SearchIndex
+from snapshot import Snapshot, is_snapshot, write_snapshot
+
+LOADED_TECHNIQUES = 5  # Сколько техник держать загруженными в памяти
+EXPORT_FORMAT = "technic-notes"  # Заголовок построчного файла экспорта
+PROGRESS_EVERY = 1000  # Как часто сообщать о ходе экспорта/импорта (заметок)
+SNAPSHOT_SUFFIX = ".snap"  # Экспорт в файл с таким расширением - двоичный снимок
+CSV_SUFFIX = ".csv"  # Экспорт в файл с таким расширением - таблица
+CSV_DELIMITER = ";"  # Разделитель, который Excel с русскими настройками открывает без вопросов
+CSV_CHUNK = 10000  # Сколько строк таблицы записывать за раз
+CSV_HEADER = ("Техника", "Дата", "Начало", "Окончание", "Минуты", "Описание")
+NOTES_PAGE = 50  # Сколько заметок читать за раз для списка на экране
+
+
+class Note:
+    # Без __dict__ у каждой заметки: три поля вместо словаря атрибутов.
+    # Даты и описания повторяются, поэтому строки общие (intern),
+    # время работы хранится целым числом секунд вместо timedelta.
+    # id - постоянный номер заметки, по нему заметку находят правка, удаление и импорт.
+    __slots__ = ("id", "date", "description", "seconds")
+
+    # def __init__(self, date, start_time, end_time, description, work_time):
+    def __init__(self, date, description, work_time, note_id=None):
+        self.id = note_id  # Выдается Ledger при добавлении
+        self.date = intern(date)
+        # self.start_time = start_time
+        # self.end_time = end_time
+        self.description = intern(description)
+        self.work_time = work_time
+
+    @property
+    def work_time(self):
+        return timedelta(seconds=self.seconds)
+
+    @work_time.setter
+    def work_time(self, value):
+        self.seconds = int(value.total_seconds())
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "date": self.date,
+            # "start_time": self.start_time,
+            # "end_time": self.end_time,
+            "description": self.description,
+            "work_time": self.seconds
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        note = cls.__new__(cls)
+        note.id = data.get("id")
+        note.date = intern(data["date"])
+        note.description = intern(data["description"])
+        note.seconds = data["work_time"]
+        return note
+
+
+def note_key(technique, note):
+    """Ключ содержимого заметки-словаря: хэш техники, даты, описания и времени работы.
+
+    В множестве хранится только число, а не сами строки. Хэш строк в Python
+    меняется от запуска к запуску, поэтому ключ годится только внутри одного процесса.
+    """
+    return hash((technique, note["date"], note["description"], note["work_time"]))
+
+
+class TechniqueNotes:
+    """Заметки одной техники в порядке добавления с поиском по id.
+
+    id растут с каждой новой заметкой, поэтому список id отсортирован
+    и номер заметки находится двоичным поиском.
+    """
+
+    def __init__(self, notes=()):
+        self.by_id = {}
+        self.ids = []
+        for note in notes:
+            self.append(note)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        by_id = self.by_id
+        return (by_id[note_id] for note_id in self.ids)
+
+    def __getitem__(self, position):
+        return self.by_id[self.ids[position]]
+
+    def __contains__(self, note_id):
+        return note_id in self.by_id
+
+    def get(self, note_id):
+        return self.by_id[note_id]
+
+    def append(self, note):
+        if self.ids and note.id < self.ids[-1]:
+            insort(self.ids, note.id)
+        else:
+            self.ids.append(note.id)
+        self.by_id[note.id] = note
+
+    def position(self, note_id):
+        """Номер заметки в списке."""
+        if note_id not in self.by_id:
+            raise KeyError(note_id)
+        return bisect_left(self.ids, note_id)
+
+    def remove(self, note_id):
+        """Удаление заметки. Возвращает номер, который у неё был."""
+        position = self.position(note_id)
+        del self.ids[position]
+        del self.by_id[note_id]
+        return position
+
+
+class Ledger:
+    def __init__(self, data_dir, storage_kind="sqlite", loaded_techniques=LOADED_TECHNIQUES, legacy_dir=".",
+                 background=False):
+        # background=True - изменения пишутся в отдельном потоке (для интерфейса)
+        self.storage = open_storage(data_dir, storage_kind, background)
+        if self.storage.is_new:
+            migrate(self.storage, data_dir, legacy_dir)  # Перенос data.json и старых .txt
+        self.loaded_techniques = loaded_techniques
+        self.notes = OrderedDict()  # Заметки загруженных техник, последняя запрошенная в конце
+        # Итоги времени работы для каждой техники, порядок ключей - порядок списка техники
+        self.totals = {}
+        self.next_id = 1  # id для следующей новой заметки
+        self.search_index = None  # Строится при первом поиске
+        self.load()
+
+    def load(self):
+        """Загрузка списка техники и итогов. Заметки загружаются по запросу."""
+        index = self.storage.load_index()
+        self.next_id = self.storage.max_note_id() + 1
+        self.search_index = None
+        self.notes = OrderedDict()
+        self.totals = {}
+        for technique in index["techniques"]:
+            totals = self.totals[technique] = TechniqueTotals()
+            for date, seconds in index["days"].get(technique, {}).items():
+                totals.add(date, seconds)
+
+    @property
+    def techniques(self):
+        """Список техники (копия: удаление техники - удаление ключа из totals без поиска по списку)."""
+        return list(self.totals)
+
+    def flush(self):
+        """Ожидание записи всех изменений на диск."""
+        self.storage.flush()
+
+    def close(self):
+        self.storage.close()
+
+    def technique_notes(self, technique):
+        """Заметки техники, загружаются из хранилища при первом обращении."""
+        notes = self.notes.get(technique)
+        if notes is None:
+            notes = self._keep_notes(technique, TechniqueNotes(
+                Note.from_dict(note) for note in self.storage.load_notes(technique)
+            ))
+        else:
+            self.notes.move_to_end(technique)
+        return notes
+
+    def _keep_notes(self, technique, notes):
+        """Заметки техники в памяти, сверх loaded_techniques выгружается давно не запрошенная."""
+        self.notes[technique] = notes
+        if len(self.notes) > self.loaded_techniques:
+            self.notes.popitem(last=False)
+        return notes
+
+    def add_technique(self, technique):
+        """Добавление новой техники."""
+        if technique in self.totals:
+            return False
+        self.totals[technique] = TechniqueTotals()
+        self._keep_notes(technique, TechniqueNotes())
+        self.storage.append({"op": "add_technique", "technique": technique})
+        return True
+
+    def delete_technique(self, technique):
+        """Удаление техники со всеми заметками."""
+        self.notes.pop(technique, None)
+        del self.totals[technique]
+        if self.search_index:
+            self.search_index.remove_technique(technique)
+        self.storage.append({"op": "delete_technique", "technique": technique})
+
+    def add_note(self, technique, note):
+        """Добавление заметки."""
+        self.add_many(technique, [note])
+        return note
+
+    def add_many(self, technique, notes):
+        """Добавление набора заметок одной записью в хранилище."""
+        self.add_batch((technique, note) for note in notes)
+
+    def add_batch(self, entries):
+        """Добавление заметок разной техники [(техника, заметка)] одной записью в хранилище."""
+        entries = list(entries)
+        records = []
+        for technique, note in entries:
+            note.id = self.next_id
+            self.next_id += 1
+            self.totals[technique].add(note.date, note.seconds)
+            if self.search_index:
+                self.search_index.add(technique, note)
+            records.append({"op": "add_note", "technique": technique, "note": note.to_dict()})
+        self.storage.append_many(records)
+        # Незагруженная техника получит новые заметки из хранилища при первом обращении
+        for technique, note in entries:
+            notes = self.notes.get(technique)
+            if notes is not None:
+                notes.append(note)
+
+    def edit_note(self, technique, note_id, work_time, note=None):
+        """Изменение времени работы заметки. Возвращает номер заметки в списке.
+
+        note - заметка со страницы page_notes: с ней заметки техники не загружаются
+        целиком, если их еще нет в памяти, номер тогда None.
+        Заметки, которой уже нет, - KeyError.
+        """
+        notes, note, date, seconds = self._find_note(technique, note_id, note)
+        totals = self.totals[technique]
+        totals.remove(date, seconds)
+        note.work_time = work_time
+        totals.add(note.date, note.seconds)
+        if self.search_index:
+            self.search_index.update_seconds(note_id, note.seconds)
+        self.storage.append({
+            "op": "edit_note",
+            "technique": technique,
+            "id": note_id,
+            "fields": {"work_time": note.seconds}
+        })
+        return notes.position(note_id) if notes is not None else None
+
+    def _find_note(self, technique, note_id, note=None):
+        """(заметки техники в памяти или None, заметка, ее дата и секунды до изменения).
+
+        Без заметок в памяти дата и время берутся из хранилища, а не со страницы:
+        страница могла устареть. Заметки, которой уже нет, - KeyError.
+        """
+        notes = self.technique_notes(technique) if note is None else self.notes.get(technique)
+        if notes is not None:
+            note = notes.get(note_id)
+            return notes, note, note.date, note.seconds
+        stored = self.storage.get_note(technique, note_id)
+        if stored is None:
+            raise KeyError(note_id)
+        return None, note, stored["date"], stored["work_time"]
+
+    def delete_note(self, technique, note_id, note=None):
+        """Удаление заметки. Возвращает номер, который был у заметки в списке.
+
+        note - как в edit_note.
+        """
+        notes, note, date, seconds = self._find_note(technique, note_id, note)
+        position = notes.remove(note_id) if notes is not None else None
+        self.totals[technique].remove(date, seconds)
+        if self.search_index:
+            self.search_index.remove(note_id)
+        self.storage.append({"op": "delete_note", "technique": technique, "id": note_id})
+        return position
+
+    def totals_by(self, period="day", techniques=None):
+        """Время работы по периодам: "day", "week", "month", "year" или "total" для всей истории."""
+        result = {}
+        for technique in techniques or self.techniques:
+            totals = self.totals[technique]
+            if period == "total":
+                result[technique] = totals.total
+            else:
+                result[technique] = dict(totals.by_period(period))
+        return result
+
+    def report(self, period="month", techniques=None):
+        """Отчет из готовых итогов: [(период, техника, секунды)], новые периоды первыми.
+
+        Заметки не читаются, время построения зависит только от числа периодов.
+        """
+        rows = []
+        for technique in techniques or self.techniques:
+            for key, seconds in self.totals[technique].by_period(period).items():
+                rows.append((key, technique, seconds))
+        rows.sort(key=lambda row: row[1])
+        rows.sort(key=lambda row: row[0], reverse=True)
+        return rows
+
+    def page_notes(self, technique, before=None, limit=NOTES_PAGE):
+        """Страница заметок техники от новых к старым (по дате, затем по id).
+
+        before - курсор (дата, id) последней заметки предыдущей страницы. Заметки
+        техники целиком не загружаются, время не зависит от их числа.
+        """
+        return [Note.from_dict(note) for note in self.storage.page_notes(technique, before, limit)]
+
+    def query(self, technique, date_from=None, date_to=None):
+        """Заметки техники за период (даты включительно)."""
+        return [Note.from_dict(note) for note in self.storage.query_notes(technique, date_from, date_to)]
+
+    def search(self, date_from=None, date_to=None, techniques=None, text=None):
+        """Поиск заметок по всей технике: период, набор техники, слова описания.
+
+        Возвращает список (техника, заметка) по возрастанию даты.
+        """
+        if self.search_index is None:
+            self.search_index = SearchIndex()
+            self.search_index.build(self.storage.iter_notes())
+        return [
+            (technique, Note.from_dict(
+                {"id": note_id, "date": date, "description": description, "work_time": seconds}
+            ))
+            for technique, note_id, date, description, seconds
+            in self.search_index.search(date_from, date_to, techniques, text)
+        ]
+
+    def export_file(self, file_path, progress=None, date_from=None, date_to=None, techniques=None):
+        """Экспорт всех данных построчно (JSON Lines): заголовок, затем одна заметка на строку.
+
+        Заметки читаются из хранилища по одной, поэтому память не растет с историей.
+        Файл с расширением .snap - двоичный снимок (см. snapshot.py), .csv - таблица
+        (см. export_csv), только для нее действует отбор по периоду и технике.
+        progress(доля) вызывается по ходу экспорта, доля от 0 до 1.
+        """
+        if file_path.endswith(SNAPSHOT_SUFFIX):
+            self._export_snapshot(file_path, progress)
+            return
+        if file_path.endswith(CSV_SUFFIX):
+            self.export_csv(file_path, date_from, date_to, techniques, progress)
+            return
+        total = self.storage.count_notes() or 1
+        header = {"format": EXPORT_FORMAT, "version": 1, "techniques": self.techniques}
+        with atomic_open(file_path) as file:
+            file.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for done, (technique, note) in enumerate(self.storage.iter_notes(), 1):
+                line = {"technique": technique, **note}
+                file.write(json.dumps(line, ensure_ascii=False) + "\n")
+                if progress and done % PROGRESS_EVERY == 0:
+                    progress(done / total)
+        if progress:
+            progress(1.0)
+
+    def export_csv(self, file_path, date_from=None, date_to=None, techniques=None, progress=None):
+        """Экспорт заметок таблицей CSV: техника, дата, начало, окончание, минуты, описание.
+
+        Период (даты включительно) и техника отбираются в хранилище, остальная история
+        не читается. Строки пишутся порциями по CSV_CHUNK. Начало и окончание заметки
+        не хранятся, эти столбцы пустые. Возвращает число записанных строк.
+        Ход экспорта считается по времени работы: сколько его в отборе, известно из итогов по дням.
+        """
+        if techniques is None:
+            techniques = self.techniques
+        techniques = [technique for technique in techniques if technique in self.totals]
+        count = 0
+        done = 0  # Время работы в записанных строках, секунды
+        total = sum(
+            seconds
+            for technique in techniques
+            for date, seconds in self.totals[technique].by_day.items()
+            if (date_from or "") <= date <= (date_to or "9999")
+        ) or 1
+        with atomic_open(file_path) as file:
+            file.write("\ufeff")  # BOM - чтобы Excel понял UTF-8
+            writer = csv.writer(file, delimiter=CSV_DELIMITER, lineterminator="\n")
+            writer.writerow(CSV_HEADER)
+            rows = self.storage.iter_rows(techniques, date_from, date_to)
+            while True:
+                chunk = list(islice(rows, CSV_CHUNK))
+                if not chunk:
+                    break
+                writer.writerows(
+                    (technique, date, "", "", seconds // 60 if seconds % 60 == 0 else round(seconds / 60, 2),
+                     description)
+                    for technique, _, date, description, seconds in chunk
+                )
+                count += len(chunk)
+                if progress:
+                    done += sum(row[4] for row in chunk)
+                    progress(min(done / total, 1.0))
+        if progress:
+            progress(1.0)
+        return count
+
+    def _export_snapshot(self, file_path, progress):
+        """Экспорт в двоичный снимок, заметки читаются по одной технике."""
+        techniques = list(self.techniques)
+        done = []
+
+        def load_notes(technique):
+            if progress:
+                progress(len(done) / (len(techniques) or 1))
+            done.append(technique)
+            return self.storage.load_notes(technique)
+
+        with atomic_open(file_path, "wb") as file:
+            write_snapshot(file, techniques, load_notes)
+        if progress:
+            progress(1.0)
+
+    def import_file(self, file_path, progress=None):
+        """Импорт данных из файла с заменой текущих.
+
+        Формат определяется по содержимому: двоичный снимок и построчный файл экспорта
+        читаются по одной заметке, обычный JSON (data.json, старый экспорт) - целиком.
+        progress(доля) вызывается по ходу импорта, доля от 0 до 1.
+        """
+        with self._read_export(file_path, progress) as (techniques, notes):
+            self.storage.replace_stream(techniques, notes)
+        if progress:
+            progress(1.0)
+        self.load()
+
+    def merge_file(self, file_path, progress=None):
+        """Импорт с объединением: добавляются только техника и заметки, которых ещё нет.
+
+        Одинаковыми считаются заметки с теми же техникой, датой, описанием и временем работы
+        (в том числе повторы внутри самого файла). Файл читается за один проход, в памяти -
+        только множество ключей заметок и очередная порция новых заметок.
+        Возвращает {"techniques": [новая техника], "notes": добавлено, "duplicates": пропущено}.
+        """
+        seen = {note_key(technique, note) for technique, note in self.storage.iter_notes()}
+        report = {"techniques": [], "notes": 0, "duplicates": 0}
+        batch = []
+        with self._read_export(file_path, progress) as (techniques, notes):
+            for technique in techniques:
+                if self.add_technique(technique):
+                    report["techniques"].append(technique)
+            for technique, note in notes:
+                key = note_key(technique, note)
+                if key in seen:
+                    report["duplicates"] += 1
+                    continue
+                seen.add(key)
+                if self.add_technique(technique):
+                    report["techniques"].append(technique)
+                batch.append((technique, Note(note["date"], note["description"],
+                                              timedelta(seconds=note["work_time"]))))
+                if len(batch) >= PROGRESS_EVERY:
+                    self.add_batch(batch)
+                    report["notes"] += len(batch)
+                    batch = []
+        self.add_batch(batch)
+        report["notes"] += len(batch)
+        if progress:
+            progress(1.0)
+        return report
+
+    @contextmanager
+    def _read_export(self, file_path, progress):
+        """Файл экспорта любого формата: (список техники, заметки по одной (техника, заметка))."""
+        if is_snapshot(file_path):
+            with Snapshot(file_path) as snapshot:
+                yield snapshot.techniques, snapshot.iter_notes()
+            return
+        size = os.path.getsize(file_path) or 1
+        with open(file_path, "rb") as file:
+            first_line = file.readline()
+            try:
+                header = json.loads(first_line)
+            except ValueError:
+                header = None
+            if isinstance(header, dict) and header.get("format") == EXPORT_FORMAT:
+                yield header["techniques"], self._read_lines(file, len(first_line), size, progress)
+                return
+        data = read_json(file_path)
+        yield data["techniques"], iter_data_notes(data)
+
+    def _read_lines(self, file, position, size, progress):
+        """Заметки построчного файла экспорта по одной: (техника, заметка)."""
+        for done, line in enumerate(file, 1):
+            position += len(line)
+            note = json.loads(line)
+            yield note.pop("technique"), note
+            if progress and done % PROGRESS_EVERY == 0:
+                progress(position / size)
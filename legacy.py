@@ -0,0 +1,37 @@
+# Перенос старых файлов заметок (.txt из main_2 - main_5) в хранилище.
+# Формат каждого файла определяется отдельно, файлы разбираются параллельно,
+# испорченные строки не останавливают перенос, а попадают в отчет.
+# Запуск: python legacy.py <папка с .txt> <папка данных> [--storage sqlite] [--processes N]
+import argparse
+from storage import open_storage, load_legacy, migrate, STORAGE_KINDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос старых файлов заметок в хранилище")
+    parser.add_argument("legacy_dir", help="Папка с techniques.txt и файлами <техника>.txt")
+    parser.add_argument("data_dir", help="Папка данных приложения")
+    parser.add_argument("--storage", default="sqlite", choices=STORAGE_KINDS)
+    parser.add_argument("--processes", type=int, default=None, help="Число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument("--listed-only", action="store_true", help="Только техника из techniques.txt")
+    args = parser.parse_args()
+
+    storage = open_storage(args.data_dir, args.storage)
+    try:
+        if storage.is_new:
+            # Сначала data.json приложения (без .txt - их переносит load_legacy с отчетом),
+            # иначе после переноса .txt база уже не новая и data.json не перенесется
+            migrate(storage, args.data_dir, args.data_dir)
+        report = load_legacy(storage, args.legacy_dir, args.processes, not args.listed_only)
+    finally:
+        storage.close()
+    for technique, result in report.items():
+        if result.get("skipped"):
+            print(f"{technique}: уже есть в хранилище, пропущена ({result['file']})")
+            continue
+        print(f"{technique}: формат {result['dialect']}, заметок {result['notes']} ({result['file']})")
+        for number, line, reason in result["malformed"]:
+            print(f"    строка {number}: {reason}: {line}")
+
+
+if __name__ == "__main__":
+    main()
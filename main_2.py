@@ -12,6 +12,8 @@ import os
 
 
 class Note:
+    __slots__ = ("date", "start_time", "end_time", "description", "work_time")  # Без __dict__ у каждой заметки
+
     def __init__(self, date, start_time, end_time, description, work_time):
         self.date = date
         self.start_time = start_time
@@ -12,6 +12,8 @@ from datetime import datetime, timedelta
 import os
 
 class Note:
+    __slots__ = ("date", "description", "start_time", "end_time", "work_time")  # Без __dict__ у каждой заметки
+
     def __init__(self, date, description, start_time, end_time, work_time):
         self.date = date
         self.description = description
@@ -12,6 +12,8 @@ import os
 import json
 
 class Note:
+    __slots__ = ("date", "description", "work_time")  # Без __dict__ у каждой заметки
+
     def __init__(self, date, description, work_time): # start_time, end_time,
         self.date = date
         self.description = description
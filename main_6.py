@@ -1,4 +1,6 @@
 # экспорт - импорт на внешний ностиель
+import time
+STARTED = time.perf_counter()  # Начало запуска, для замера времени до готовности к работе
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
@@ -6,37 +8,69 @@ from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.spinner import Spinner
 from kivy.uix.popup import Popup
-from kivy.uix.gridlayout import GridLayout
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.properties import ObjectProperty, StringProperty
+from kivy.clock import Clock
 # from kivy.uix.datepicker import DatePicker
-from kivy.uix.filechooser import FileChooserListView
+# FileChooserListView импортируется при первом экспорте/импорте: он тянет за собой kivy.lang
 from datetime import datetime, timedelta
 import os
-import json
-
-class Note:
-    # def __init__(self, date, start_time, end_time, description, work_time):
-    def __init__(self, date, description, work_time):
-        self.date = date
-        # self.start_time = start_time
-        # self.end_time = end_time
-        self.description = description
-        self.work_time = work_time
+import threading
+from ledger import Ledger, Note, NOTES_PAGE
+from totals import format_duration
+from session import Session, save_sessions, load_sessions, format_elapsed
+import profiling
+from profiling import timed
+
+STORAGE = "sqlite"  # Тип хранилища: "sqlite" (data.db) или "journal" (data.json + журнал)
+TICK = 0.5  # Как часто обновлять время текущего сеанса, секунды
+PRELOAD = 0.2  # Следующая страница заметок запрашивается, когда до конца списка осталось столько прокрутки
+
+class NoteRow(RecycleDataViewBehavior, BoxLayout):
+    """Строка списка заметок. Виджеты строк переиспользуются RecycleView."""
+    text = StringProperty("")
+    note = ObjectProperty(None, allownone=True)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        profiling.count("widgets.NoteRow")
+        self.note_label = Label()
+        edit_button = Button(text="Изменить", size_hint_x=None, width=100)
+        edit_button.bind(on_press=lambda btn: App.get_running_app().edit_note(self.note))
+        delete_button = Button(text="Удалить", size_hint_x=None, width=100)
+        delete_button.bind(on_press=lambda btn: App.get_running_app().delete_note(self.note))
+        self.add_widget(self.note_label)
+        self.add_widget(edit_button)
+        self.add_widget(delete_button)
+
+    def on_text(self, instance, value):
+        self.note_label.text = value
 
 class MainApp(App):
+    @timed()
     def build(self):
-        self.techniques = []  # Список техники
-        self.notes = {}  # Заметки для каждой техники
+        # Техника, заметки и итоги загружаются после первого кадра (start_ledger)
+        self.ledger = None
         self.current_technique = None  # Выбранная техника
-        self.start_time = None
-        self.end_time = None
+        self.session_path = os.path.join(self.user_data_dir, "session.json")
+        self.sessions = load_sessions(self.session_path)  # Идущие сеансы: техника -> сеанс
+        self.session_buttons = {}  # Техника -> кнопка сеанса в полосе активных сеансов
+        self.session_timer = None  # Обновление времени сеансов на экране
+        # Список заметок читается страницами от новых к старым
+        self.notes_cursor = None  # (дата, id) последней прочитанной заметки
+        self.notes_done = True  # Прочитаны все заметки техники
+        self.notes_loading = False  # Идет чтение следующей страницы
+        self.notes_generation = 0  # Меняется при смене техники: старые страницы отбрасываются
+        self.notes_scroll_above = None  # Прокрутка от начала списка до добавления страницы
         self.selected_date = datetime.now().strftime("%Y-%m-%d")  # Текущая дата
 
         # Основной интерфейс
         self.layout = BoxLayout(orientation="vertical", padding=10, spacing=10)
 
         # Выбор техники
-        self.technique_spinner = Spinner(text="Выберите технику", values=self.techniques)
+        self.technique_spinner = Spinner(text="Выберите технику", values=[])
         self.technique_spinner.bind(text=self.select_technique)
         self.layout.add_widget(self.technique_spinner)
 
@@ -59,21 +93,33 @@ class MainApp(App):
         self.date_button.bind(on_press=self.show_date_picker)
         self.layout.add_widget(self.date_button)
 
+        # Активные сеансы всей техники, нажатие выбирает технику
+        self.sessions_strip = BoxLayout(size_hint_y=None, height=40, spacing=5)
+        self.stop_all_button = Button(text="Завершить все", size_hint_x=None, width=150)
+        self.stop_all_button.bind(on_press=self.stop_all_sessions)
+        self.sessions_strip.add_widget(self.stop_all_button)
+        self.layout.add_widget(self.sessions_strip)
+
         # Кнопки для времени
         self.time_buttons = BoxLayout(size_hint_y=None, height=50)
         self.start_button = Button(text="Начало")
         self.start_button.bind(on_press=self.record_start_time)
+        self.pause_button = Button(text="Пауза")
+        self.pause_button.bind(on_press=self.pause_session)
         self.end_button = Button(text="Окончание")
         self.end_button.bind(on_press=self.record_end_time)
         self.time_buttons.add_widget(self.start_button)
+        self.time_buttons.add_widget(self.pause_button)
         self.time_buttons.add_widget(self.end_button)
         self.layout.add_widget(self.time_buttons)
 
         # Отображение времени начала и окончания
         self.time_labels = BoxLayout(orientation="vertical", spacing=10)
         self.start_time_label = Label(text="Время начала: --:--")
+        self.elapsed_label = Label(text="Время работы: 00:00:00")  # Единственный виджет, который обновляет таймер
         self.end_time_label = Label(text="Время окончания: --:--")
         self.time_labels.add_widget(self.start_time_label)
+        self.time_labels.add_widget(self.elapsed_label)
         self.time_labels.add_widget(self.end_time_label)
         self.layout.add_widget(self.time_labels)
 
@@ -88,26 +134,69 @@ class MainApp(App):
         self.export_button.bind(on_press=self.show_export_filechooser)
         self.import_button = Button(text="Импорт данных")
         self.import_button.bind(on_press=self.show_import_filechooser)
+        self.search_button = Button(text="Поиск")
+        self.search_button.bind(on_press=self.show_search)
+        self.report_button = Button(text="Отчет")
+        self.report_button.bind(on_press=self.show_report)
+        self.sync_button = Button(text="Синхр.")
+        self.sync_button.bind(on_press=self.show_sync)
         self.export_import_buttons.add_widget(self.export_button)
         self.export_import_buttons.add_widget(self.import_button)
+        self.export_import_buttons.add_widget(self.search_button)
+        self.export_import_buttons.add_widget(self.report_button)
+        self.export_import_buttons.add_widget(self.sync_button)
+        if profiling.ENABLED:
+            # Замеры видны только в отладочной сборке
+            self.profile_button = Button(text="Профиль")
+            self.profile_button.bind(on_press=self.show_profile)
+            self.export_import_buttons.add_widget(self.profile_button)
+            Clock.schedule_interval(lambda dt: profiling.record("frame", dt), 0)  # Время между кадрами
         self.layout.add_widget(self.export_import_buttons)
 
         # Список заметок
-        self.notes_scroll = ScrollView()
-        self.notes_layout = GridLayout(cols=1, spacing=10, size_hint_y=None)
+        # Создаются только видимые строки, остальные берутся из data
+        self.notes_view = RecycleView(viewclass="NoteRow")
+        self.notes_layout = RecycleBoxLayout(
+            orientation="vertical",
+            spacing=10,
+            size_hint_y=None,
+            default_size=(None, 40),
+            default_size_hint=(1, None)
+        )
         self.notes_layout.bind(minimum_height=self.notes_layout.setter("height"))
-        self.notes_scroll.add_widget(self.notes_layout)
-        self.layout.add_widget(self.notes_scroll)
+        self.notes_layout.bind(height=self.keep_notes_scroll)
+        self.notes_view.bind(scroll_y=self.on_notes_scroll)
+        self.notes_view.add_widget(self.notes_layout)
+        self.layout.add_widget(self.notes_view)
 
         # Общее время работы
         self.total_time_label = Label(text="Общее время работы: 00:00")
         self.layout.add_widget(self.total_time_label)
 
-        # Загрузка данных при запуске
-        self.load_data()
+        self.show_session()  # Сеансы, которые шли при закрытии приложения
+
+        # Первый кадр показывается сразу, данные загружаются следующим тиком после него.
+        # До загрузки интерфейс виден, но не принимает нажатий.
+        self.layout.disabled = True
+        Clock.schedule_once(lambda dt: Clock.schedule_once(self.start_ledger), 0)
 
         return self.layout
 
+    @timed()
+    def start_ledger(self, dt=None):
+        """Открытие хранилища и загрузка данных после первого кадра."""
+        if self.ledger is not None:
+            return
+        first_frame = time.perf_counter() - STARTED
+        # Техника, заметки и итоги; запись на диск идет в фоне, не задерживая нажатия
+        self.ledger = Ledger(self.user_data_dir, STORAGE, background=True)
+        self.load_data()
+        self.layout.disabled = False
+        ready = time.perf_counter() - STARTED
+        profiling.record("startup.first_frame", first_frame)
+        profiling.record("startup.first_interaction", ready)
+        print(f"Первый кадр: {first_frame * 1000:.0f} мс, готово к работе: {ready * 1000:.0f} мс")
+
     def show_date_picker(self, instance):
         """Отображение DatePicker для выбора даты."""
         content = BoxLayout(orientation="vertical", padding=10, spacing=10)
@@ -126,10 +215,12 @@ class MainApp(App):
         popup.content = content
         popup.open()
 
+    @timed()
     def select_technique(self, spinner, text):
         """Выбор техники."""
         self.current_technique = text
         self.update_notes()
+        self.show_session()
 
     def add_technique(self, instance):
         """Добавление новой техники."""
@@ -140,10 +231,8 @@ class MainApp(App):
 
         def save(instance):
             if name_input.text:
-                self.techniques.append(name_input.text)
-                self.technique_spinner.values = self.techniques
-                self.notes[name_input.text] = []
-                self.save_data()  # Сохранение данных
+                self.ledger.add_technique(name_input.text)
+                self.technique_spinner.values = self.ledger.techniques
                 popup.dismiss()
 
         save_button.bind(on_press=save)
@@ -155,92 +244,274 @@ class MainApp(App):
     def delete_technique(self, instance):
         """Удаление техники."""
         if self.current_technique:
-            self.techniques.remove(self.current_technique)
-            self.technique_spinner.values = self.techniques
-            del self.notes[self.current_technique]
+            self.ledger.delete_technique(self.current_technique)
+            if self.sessions.pop(self.current_technique, None):
+                save_sessions(self.session_path, self.sessions)
+            self.technique_spinner.values = self.ledger.techniques
             self.current_technique = None
             self.update_notes()
-            self.save_data()  # Сохранение данных
+            self.show_session()
+
+    def current_session(self):
+        """Сеанс выбранной техники или None."""
+        return self.sessions.get(self.current_technique)
 
     def record_start_time(self, instance):
-        """Фиксация времени начала."""
-        self.start_time = datetime.now().strftime("%H:%M")
-        self.start_time_label.text = f"Время начала: {self.start_time}"
+        """Начало сеанса выбранной техники или продолжение после паузы."""
+        if not self.current_technique:
+            return
+        session = self.current_session()
+        if session is None or session.stopped:
+            session = self.sessions[self.current_technique] = Session(
+                self.selected_date, self.description_input.text
+            )
+        session.start()
+        save_sessions(self.session_path, self.sessions)
+        self.show_session()
+
+    def pause_session(self, instance):
+        """Пауза сеанса выбранной техники или продолжение."""
+        session = self.current_session()
+        if session and not session.stopped:
+            if session.running:
+                session.pause()
+            else:
+                session.start()
+            save_sessions(self.session_path, self.sessions)
+            self.show_session()
 
     def record_end_time(self, instance):
-        """Фиксация времени окончания."""
-        self.end_time = datetime.now().strftime("%H:%M")
-        self.end_time_label.text = f"Время окончания: {self.end_time}"
-
+        """Окончание сеанса выбранной техники."""
+        session = self.current_session()
+        if session and not session.stopped:
+            session.stop()
+            save_sessions(self.session_path, self.sessions)
+            self.show_session()
+
+    def show_session(self):
+        """Отображение сеанса выбранной техники, полосы активных сеансов и запуск/остановка таймера."""
+        session = self.current_session()
+        if session and session.started_at:
+            started = datetime.fromtimestamp(session.started_at).strftime("%H:%M:%S")
+            self.start_time_label.text = f"Время начала: {started}"
+        else:
+            self.start_time_label.text = "Время начала: --:--"
+        if session and session.stopped:
+            ended = datetime.fromtimestamp(session.ended_at).strftime("%H:%M:%S")
+            self.end_time_label.text = f"Время окончания: {ended}"
+        else:
+            self.end_time_label.text = "Время окончания: --:--"
+        self.pause_button.text = "Продолжить" if session and not session.running and not session.stopped else "Пауза"
+
+        # Кнопки полосы создаются и удаляются только для начатых и законченных сеансов
+        for technique in [technique for technique in self.session_buttons if technique not in self.sessions]:
+            self.sessions_strip.remove_widget(self.session_buttons.pop(technique))
+        for technique in self.sessions:
+            if technique not in self.session_buttons:
+                button = self.session_buttons[technique] = Button()
+                profiling.count("widgets.session_button")
+                button.bind(on_press=lambda btn, technique=technique: setattr(
+                    self.technique_spinner, "text", technique
+                ))
+                self.sessions_strip.add_widget(button, index=1)  # Перед "Завершить все"
+
+        self.tick()
+        if any(session.running for session in self.sessions.values()):
+            if self.session_timer is None:
+                self.session_timer = Clock.schedule_interval(self.tick, TICK)
+        elif self.session_timer is not None:
+            self.session_timer.cancel()
+            self.session_timer = None
+
+    def tick(self, dt=None):
+        """Обновление времени сеансов: меняются только надписи сеансов, не список заметок."""
+        for technique, button in self.session_buttons.items():
+            session = self.sessions[technique]
+            mark = "" if session.running else (" (стоп)" if session.stopped else " (пауза)")
+            text = f"{technique} {format_elapsed(session.seconds())}{mark}"
+            if button.text != text:
+                button.text = text
+        session = self.current_session()
+        text = f"Время работы: {format_elapsed(session.seconds() if session else 0)}"
+        if self.elapsed_label.text != text:
+            self.elapsed_label.text = text
+
+    def session_note(self, session, description):
+        """Заметка из законченного сеанса."""
+        return Note(
+            date=session.date,  # День начала сеанса, даже если он закончился после полуночи
+            # start_time=self.start_time,
+            # end_time=self.end_time,
+            description=description,
+            work_time=timedelta(seconds=round(session.elapsed))  # По секундомеру, с точностью до секунды
+        )
+
+    @timed()
     def add_note(self, instance):
-        """Добавление заметки."""
-        if self.current_technique and self.start_time and self.end_time:
-            # Расчет времени работы
-            start = datetime.strptime(self.start_time, "%H:%M")
-            end = datetime.strptime(self.end_time, "%H:%M")
-            delta = end - start
-            minutes = delta.seconds // 60
-            if delta.seconds % 60 != 0:
-                minutes += 1  # Округление в большую сторону
-            work_time = timedelta(minutes=minutes)
-
-            # Создание заметки
-            note = Note(
-                date=self.selected_date,
-                # start_time=self.start_time,
-                # end_time=self.end_time,
-                description=self.description_input.text,
-                work_time=work_time
-            )
+        """Добавление заметки из законченного сеанса выбранной техники."""
+        session = self.current_session()
+        if self.current_technique and session and session.stopped:
+            note = self.session_note(session, self.description_input.text)
 
             # Добавление заметки
-            self.notes[self.current_technique].append(note)
-            self.update_notes()
-            self.save_data()  # Сохранение данных
+            self.ledger.add_note(self.current_technique, note)
+            self.insert_note_row(note)
+            self.update_total_time()
 
             # Очистка полей
-            self.start_time = None
-            self.end_time = None
+            del self.sessions[self.current_technique]
+            save_sessions(self.session_path, self.sessions)
             self.description_input.text = ""
-            self.start_time_label.text = "Время начала: --:--"
-            self.end_time_label.text = "Время окончания: --:--"
-
+            self.show_session()
+
+    @timed()
+    def stop_all_sessions(self, instance):
+        """Окончание всех сеансов: заметки всей техники и сеансы записываются по одному разу."""
+        if not self.sessions:
+            return
+        entries = []
+        for technique, session in self.sessions.items():
+            session.stop()
+            if technique in self.ledger.totals:  # Техника могла исчезнуть при импорте
+                entries.append((technique, self.session_note(session, session.description)))
+        self.ledger.add_batch(entries)
+        self.sessions.clear()
+        save_sessions(self.session_path, self.sessions)
+        for technique, note in entries:
+            if technique == self.current_technique:
+                self.insert_note_row(note)
+        self.update_total_time()
+        self.show_session()
+
+    def note_row(self, note):
+        """Данные одной строки списка заметок."""
+        return {"text": f"{note.date} {note.description} {note.work_time}", "note": note}
+
+    def note_row_index(self, note_id):
+        """Номер строки заметки в списке, None - заметка еще не прочитана."""
+        for index, row in enumerate(self.notes_view.data):
+            if row["note"].id == note_id:
+                return index
+        return None
+
+    def cancel_notes_page(self):
+        """Отмена чтения страницы, начатого до изменения заметок: в ней может не быть изменения.
+
+        Вызывается после изменения в Ledger, поэтому новое чтение его уже увидит.
+        """
+        if self.notes_loading:
+            self.notes_generation += 1
+            self.notes_loading = False
+            self.on_notes_scroll(self.notes_view, self.notes_view.scroll_y)
+
+    def insert_note_row(self, note):
+        """Новая заметка на свое место в списке (от новых к старым)."""
+        self.cancel_notes_page()
+        data = self.notes_view.data
+        key = (note.date, note.id)
+        if not self.notes_done and key < tuple(self.notes_cursor):
+            return  # Старше прочитанных страниц - придет со следующей
+        index = len(data)
+        for position, row in enumerate(data):
+            if (row["note"].date, row["note"].id) < key:
+                index = position
+                break
+        data.insert(index, self.note_row(note))
+
+    @timed()
     def update_notes(self):
-        """Обновление списка заметок."""
-        self.notes_layout.clear_widgets()
+        """Обновление списка заметок: первая страница сразу, следующие - при прокрутке."""
+        self.notes_generation += 1
+        self.notes_cursor = None
+        self.notes_loading = False
+        self.notes_scroll_above = None
+        self.notes_view.data = []
+        self.notes_view.scroll_y = 1
+        self.notes_done = not self.current_technique
+        if self.current_technique:
+            self.add_notes_page(self.ledger.page_notes(self.current_technique))
+        self.update_total_time()
+
+    def add_notes_page(self, notes):
+        """Добавление прочитанной страницы в конец списка."""
+        self.notes_done = len(notes) < NOTES_PAGE
+        if notes:
+            self.notes_cursor = (notes[-1].date, notes[-1].id)
+            view = self.notes_view
+            self.notes_scroll_above = (1 - view.scroll_y) * max(self.notes_layout.height - view.height, 0)
+            view.data.extend(self.note_row(note) for note in notes)
+
+    def keep_notes_scroll(self, layout, height):
+        """Список вырос на страницу: видимые строки остаются на месте экрана."""
+        if self.notes_scroll_above is not None:
+            scrollable = height - self.notes_view.height
+            if scrollable > 0:
+                self.notes_view.scroll_y = max(0.0, 1 - self.notes_scroll_above / scrollable)
+            self.notes_scroll_above = None
+
+    def on_notes_scroll(self, view, scroll_y):
+        """Близко к концу списка - чтение следующей страницы в отдельном потоке."""
+        if scroll_y > PRELOAD or self.notes_done or self.notes_loading:
+            return
+        self.notes_loading = True
+        technique, cursor, generation = self.current_technique, self.notes_cursor, self.notes_generation
+
+        def finish(notes):
+            if generation != self.notes_generation:
+                return  # Пока читали, выбрали другую технику или изменили заметки
+            self.notes_loading = False
+            if notes is None:
+                return  # Ошибка чтения, следующая прокрутка попробует снова
+            self.add_notes_page(notes)
+            # Если страница уже видна целиком, а заметки еще есть - следующая
+            self.on_notes_scroll(view, view.scroll_y)
+
+        def load():
+            try:
+                notes = self.ledger.page_notes(technique, cursor)
+            except Exception as error:
+                print(f"Не удалось прочитать заметки: {error}")
+                notes = None
+            Clock.schedule_once(lambda dt: finish(notes))
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def update_total_time(self):
+        """Обновление общего времени работы."""
         if self.current_technique:
-            total_time = timedelta()
-            for note in self.notes[self.current_technique]:
-                note_layout = BoxLayout(size_hint_y=None, height=40)
-                # note_label = Label(text=f"{note.date} {note.start_time}-{note.end_time} {note.description} (Время работы: {note.work_time})")
-                note_label = Label(text=f"{note.date} {note.description} {note.work_time}")
-                edit_button = Button(text="Изменить", size_hint_x=None, width=100)
-                edit_button.bind(on_press=lambda btn, n=note: self.edit_note(n))
-                delete_button = Button(text="Удалить", size_hint_x=None, width=100)
-                delete_button.bind(on_press=lambda btn, n=note: self.delete_note(n))
-                note_layout.add_widget(note_label)
-                note_layout.add_widget(edit_button)
-                note_layout.add_widget(delete_button)
-                self.notes_layout.add_widget(note_layout)
-                total_time += note.work_time
-            self.total_time_label.text = f"Общее время работы: {total_time.seconds // 3600:02}:{(total_time.seconds % 3600) // 60:02}"
+            totals = self.ledger.totals[self.current_technique]
+            month = totals.month(self.selected_date[:7])
+            self.total_time_label.text = (
+                f"Общее время работы: {format_duration(totals.total)} "
+                f"(за месяц: {format_duration(month)})"
+            )
 
+    @timed()
     def edit_note(self, note):
         """Редактирование времени работы заметки."""
         content = BoxLayout(orientation="vertical", padding=10, spacing=10)
-        work_time_input = TextInput(hint_text="Время работы (минуты)", text=str(note.work_time.seconds // 60))
+        work_time_input = TextInput(hint_text="Время работы (минуты)", text=str(note.seconds // 60))
         save_button = Button(text="Сохранить")
         popup = Popup(title="Редактирование времени работы", size_hint=(0.8, 0.4))
 
         def save(instance):
             try:
                 minutes = int(work_time_input.text)
-                note.work_time = timedelta(minutes=minutes)
-                self.update_notes()
-                self.save_data()  # Сохранение данных
+                if minutes < 0:
+                    raise ValueError("время работы не может быть отрицательным")
+                self.ledger.edit_note(self.current_technique, note.id, timedelta(minutes=minutes), note)
+                self.cancel_notes_page()
+                note.work_time = timedelta(minutes=minutes)  # Заметка строки может быть копией загруженной
+                index = self.note_row_index(note.id)
+                if index is not None:
+                    self.notes_view.data[index] = self.note_row(note)  # Обновляется одна строка
+                self.update_total_time()
                 popup.dismiss()
             except ValueError:
                 pass
+            except KeyError:
+                popup.dismiss()  # Заметку уже удалили
+                self.update_notes()
 
         save_button.bind(on_press=save)
         content.add_widget(work_time_input)
@@ -248,141 +519,311 @@ class MainApp(App):
         popup.content = content
         popup.open()
 
+    @timed()
     def delete_note(self, note):
         """Удаление заметки."""
         if self.current_technique:
-            self.notes[self.current_technique].remove(note)
-            self.update_notes()
-            self.save_data()  # Сохранение данных
-
-    def save_data(self):
-        """Сохранение данных в файл."""
-        data = {
-            "techniques": self.techniques,
-            "notes": {
-                technique: [
-                    {
-                        "date": note.date,
-                        # "start_time": note.start_time,
-                        # "end_time": note.end_time,
-                        "description": note.description,
-                        "work_time": note.work_time.seconds
-                    }
-                    for note in notes
-                ]
-                for technique, notes in self.notes.items()
-            }
-        }
-        file_path = os.path.join(self.user_data_dir, "data.json")
-        with open(file_path, "w", encoding="utf-8") as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
-
+            try:
+                self.ledger.delete_note(self.current_technique, note.id, note)
+            except KeyError:
+                pass  # Уже удалена, убираем только строку
+            self.cancel_notes_page()
+            index = self.note_row_index(note.id)
+            if index is not None:
+                del self.notes_view.data[index]
+            self.update_total_time()
+
+    @timed()
     def load_data(self):
-        """Загрузка данных из файла."""
-        file_path = os.path.join(self.user_data_dir, "data.json")
-        if os.path.exists(file_path):
-            with open(file_path, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                self.techniques = data["techniques"]
-                self.technique_spinner.values = self.techniques
-                self.notes = {
-                    technique: [
-                        Note(
-                            note["date"],
-                            # note["start_time"],
-                            # note["end_time"],
-                            note["description"],
-                            timedelta(seconds=note["work_time"])
-                        )
-                        for note in notes
-                    ]
-                    for technique, notes in data["notes"].items()
-                }
-                self.update_notes()
+        """Загрузка списка техники и итогов. Заметки загружаются при выборе техники."""
+        self.technique_spinner.values = self.ledger.techniques
+        if self.current_technique not in self.ledger.totals:
+            self.current_technique = None
+        self.update_notes()
+
+    def on_pause(self):
+        """Запись всех изменений, пока Android не выгрузил приложение."""
+        if self.ledger:
+            try:
+                self.ledger.flush()
+            except Exception as error:
+                print(f"Изменения не записаны: {error}")
+        save_sessions(self.session_path, self.sessions)
+        profiling.dump(os.path.join(self.user_data_dir, "profile.log"))
+        return True
+
+    def on_stop(self):
+        """Запись изменений и закрытие хранилища при закрытии приложения."""
+        if self.ledger:
+            try:
+                self.ledger.close()
+            except Exception as error:
+                print(f"Изменения не записаны: {error}")
+        save_sessions(self.session_path, self.sessions)
+        profiling.dump(os.path.join(self.user_data_dir, "profile.log"))
+
+    def show_profile(self, instance):
+        """Замеры времени и счетчики (только при TECHNIC_PROFILE=1)."""
+        content = BoxLayout(orientation="vertical", padding=10, spacing=10)
+        profile_view = RecycleView(viewclass="Label")
+        profile_layout = RecycleBoxLayout(
+            orientation="vertical",
+            size_hint_y=None,
+            default_size=(None, 30),
+            default_size_hint=(1, None)
+        )
+        profile_layout.bind(minimum_height=profile_layout.setter("height"))
+        profile_view.add_widget(profile_layout)
+        profile_view.data = [{"text": line} for line in profiling.report()]
+        close_button = Button(text="Закрыть", size_hint_y=None, height=50)
+        popup = Popup(title="Профиль", content=content, size_hint=(0.95, 0.95))
+        close_button.bind(on_press=popup.dismiss)
+        content.add_widget(profile_view)
+        content.add_widget(close_button)
+        popup.open()
+
+    @timed()
+    def show_search(self, instance):
+        """Поиск заметок по всей технике: период, техника, текст описания."""
+        all_techniques = "Вся техника"
+        content = BoxLayout(orientation="vertical", padding=10, spacing=10)
+        text_input = TextInput(hint_text="Текст описания", multiline=False, size_hint_y=None, height=50)
+        dates = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        date_from_input = TextInput(hint_text="С (ГГГГ-ММ-ДД)", multiline=False)
+        date_to_input = TextInput(hint_text="По (ГГГГ-ММ-ДД)", multiline=False)
+        dates.add_widget(date_from_input)
+        dates.add_widget(date_to_input)
+        technique_spinner = Spinner(
+            text=self.current_technique or all_techniques,
+            values=[all_techniques] + self.ledger.techniques,
+            size_hint_y=None,
+            height=50
+        )
+        find_button = Button(text="Найти", size_hint_y=None, height=50)
+        result_label = Label(size_hint_y=None, height=40)
+        results_view = RecycleView(viewclass="Label")
+        results_layout = RecycleBoxLayout(
+            orientation="vertical",
+            size_hint_y=None,
+            default_size=(None, 40),
+            default_size_hint=(1, None)
+        )
+        results_layout.bind(minimum_height=results_layout.setter("height"))
+        results_view.add_widget(results_layout)
+        popup = Popup(title="Поиск", size_hint=(0.9, 0.9))
+
+        def find(instance):
+            techniques = None
+            if technique_spinner.text != all_techniques:
+                techniques = {technique_spinner.text}
+            found = self.ledger.search(
+                date_from=date_from_input.text.strip() or None,
+                date_to=date_to_input.text.strip() or None,
+                techniques=techniques,
+                text=text_input.text
+            )
+            results_view.data = [
+                {"text": f"{technique}: {note.date} {note.description} {note.work_time}"}
+                for technique, note in found
+            ]
+            total = sum(note.seconds for _, note in found)
+            result_label.text = f"Найдено: {len(found)}, время работы: {format_duration(total)}"
+
+        find_button.bind(on_press=find)
+        content.add_widget(text_input)
+        content.add_widget(dates)
+        content.add_widget(technique_spinner)
+        content.add_widget(find_button)
+        content.add_widget(result_label)
+        content.add_widget(results_view)
+        popup.content = content
+        popup.open()
+
+    @timed()
+    def show_report(self, instance):
+        """Отчет о времени работы техники по дням, неделям, месяцам и годам."""
+        periods = {"По дням": "day", "По неделям": "week", "По месяцам": "month", "По годам": "year"}
+        all_techniques = "Вся техника"
+        content = BoxLayout(orientation="vertical", padding=10, spacing=10)
+        choices = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        period_spinner = Spinner(text="По месяцам", values=list(periods))
+        technique_spinner = Spinner(
+            text=self.current_technique or all_techniques,
+            values=[all_techniques] + self.ledger.techniques
+        )
+        choices.add_widget(period_spinner)
+        choices.add_widget(technique_spinner)
+        report_view = RecycleView(viewclass="Label")
+        report_layout = RecycleBoxLayout(
+            orientation="vertical",
+            size_hint_y=None,
+            default_size=(None, 40),
+            default_size_hint=(1, None)
+        )
+        report_layout.bind(minimum_height=report_layout.setter("height"))
+        report_view.add_widget(report_layout)
+        popup = Popup(title="Отчет", size_hint=(0.9, 0.9))
+
+        def update(*args):
+            techniques = None
+            if technique_spinner.text != all_techniques:
+                techniques = [technique_spinner.text]
+            rows = self.ledger.report(periods[period_spinner.text], techniques)
+            report_view.data = [
+                {"text": f"{key}   {technique}   {format_duration(seconds)}"}
+                for key, technique, seconds in rows
+            ]
+
+        period_spinner.bind(text=update)
+        technique_spinner.bind(text=update)
+        update()
+        content.add_widget(choices)
+        content.add_widget(report_view)
+        popup.content = content
+        popup.open()
+
+    @timed()
+    def show_sync(self, instance):
+        """Синхронизация с сервером в локальной сети (python sync.py serve на компьютере)."""
+        from sync import SyncClient
+        client = SyncClient(self.user_data_dir)
+        content = BoxLayout(orientation="vertical", padding=10, spacing=10)
+        address_input = TextInput(
+            hint_text="Адрес сервера, например http://192.168.0.10:8765",
+            text=client.server, multiline=False, size_hint_y=None, height=50
+        )
+        status_label = Label(text="")
+        sync_button = Button(text="Синхронизировать", size_hint_y=None, height=50)
+        popup = Popup(title="Синхронизация", size_hint=(0.9, 0.5))
+
+        def finish(changes, state, response, error):
+            sync_button.disabled = False
+            if error:
+                status_label.text = f"Ошибка синхронизации: {error}"
+                return
+            received = client.apply(self.ledger, state, response)
+            self.load_data()
+            status_label.text = f"Отправлено: {len(changes)}, получено: {received}"
+
+        def exchange(techniques):
+            # Чтение изменений и сеть - в отдельном потоке, заметки меняются только в основном
+            changes = state = response = error = None
+            try:
+                changes, state = client.local_changes(self.ledger.storage, techniques)
+                response = client.exchange(changes)
+            except Exception as exc:
+                error = exc
+            Clock.schedule_once(lambda dt: finish(changes, state, response, error))
+
+        def start(instance):
+            if not address_input.text.strip():
+                return
+            client.server = address_input.text.strip()
+            sync_button.disabled = True
+            status_label.text = "Синхронизация..."
+            threading.Thread(target=exchange, args=(self.ledger.techniques,), daemon=True).start()
+
+        sync_button.bind(on_press=start)
+        content.add_widget(address_input)
+        content.add_widget(status_label)
+        content.add_widget(sync_button)
+        popup.content = content
+        popup.open()
 
+    @timed()
     def show_export_filechooser(self, instance):
         """Отображение FileChooser для экспорта данных."""
+        from kivy.uix.filechooser import FileChooserListView
         content = BoxLayout(orientation="vertical", padding=10, spacing=10)
         filechooser = FileChooserListView()
-        save_button = Button(text="Экспорт")
+        # Отбор только для таблицы .csv, остальные форматы - все данные для импорта
+        all_techniques = "Вся техника"
+        filters = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        date_from_input = TextInput(hint_text="CSV с (ГГГГ-ММ-ДД)", multiline=False)
+        date_to_input = TextInput(hint_text="CSV по (ГГГГ-ММ-ДД)", multiline=False)
+        technique_spinner = Spinner(text=all_techniques, values=[all_techniques] + self.ledger.techniques)
+        filters.add_widget(date_from_input)
+        filters.add_widget(date_to_input)
+        filters.add_widget(technique_spinner)
+        save_button = Button(text="Экспорт", size_hint_y=None, height=50)
         popup = Popup(title="Экспорт данных", size_hint=(0.9, 0.9))
 
         def save(instance):
             if filechooser.selection:
                 file_path = filechooser.selection[0]
-                self.export_data(file_path)
+                techniques = None
+                if technique_spinner.text != all_techniques:
+                    techniques = [technique_spinner.text]
+                self.export_data(
+                    file_path,
+                    date_from=date_from_input.text.strip() or None,
+                    date_to=date_to_input.text.strip() or None,
+                    techniques=techniques
+                )
                 popup.dismiss()
 
         save_button.bind(on_press=save)
         content.add_widget(filechooser)
+        content.add_widget(filters)
         content.add_widget(save_button)
         popup.content = content
         popup.open()
 
+    @timed()
     def show_import_filechooser(self, instance):
         """Отображение FileChooser для импорта данных."""
+        from kivy.uix.filechooser import FileChooserListView
         content = BoxLayout(orientation="vertical", padding=10, spacing=10)
         filechooser = FileChooserListView()
-        load_button = Button(text="Импорт")
+        buttons = BoxLayout(size_hint_y=None, height=50, spacing=10)
+        load_button = Button(text="Импорт (заменить)")
+        merge_button = Button(text="Объединить")
         popup = Popup(title="Импорт данных", size_hint=(0.9, 0.9))
 
         def load(instance):
             if filechooser.selection:
                 file_path = filechooser.selection[0]
-                self.import_data(file_path)
+                if instance is merge_button:
+                    self.merge_data(file_path)
+                else:
+                    self.import_data(file_path)
                 popup.dismiss()
 
         load_button.bind(on_press=load)
+        merge_button.bind(on_press=load)
+        buttons.add_widget(load_button)
+        buttons.add_widget(merge_button)
         content.add_widget(filechooser)
-        content.add_widget(load_button)
+        content.add_widget(buttons)
         popup.content = content
         popup.open()
 
-    def export_data(self, file_path):
-        """Экспорт данных в выбранный файл."""
-        data = {
-            "techniques": self.techniques,
-            "notes": {
-                technique: [
-                    {
-                        "date": note.date,
-                        # "start_time": note.start_time,
-                        # "end_time": note.end_time,
-                        "description": note.description,
-                        "work_time": note.work_time.seconds
-                    }
-                    for note in notes
-                ]
-                for technique, notes in self.notes.items()
-            }
-        }
-        with open(file_path, "w", encoding="utf-8") as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
+    @timed()
+    def export_data(self, file_path, date_from=None, date_to=None, techniques=None):
+        """Экспорт данных в выбранный файл, в .csv - таблицей с отбором по периоду и технике."""
+        self.ledger.export_file(file_path, date_from=date_from, date_to=date_to, techniques=techniques)
         print(f"Данные экспортированы в файл: {file_path}")
 
+    @timed()
     def import_data(self, file_path):
         """Импорт данных из выбранного файла."""
         if os.path.exists(file_path):
-            with open(file_path, "r", encoding="utf-8") as file:
-                data = json.load(file)
-                self.techniques = data["techniques"]
-                self.technique_spinner.values = self.techniques
-                self.notes = {
-                    technique: [
-                        Note(
-                            note["date"],
-                            # note["start_time"],
-                            # note["end_time"],
-                            note["description"],
-                            timedelta(seconds=note["work_time"])
-                        )
-                        for note in notes
-                    ]
-                    for technique, notes in data["notes"].items()
-                }
-                self.update_notes()
-                self.save_data()  # Сохранение данных в приложение
-                print(f"Данные импортированы из файла: {file_path}")
+            self.ledger.import_file(file_path)  # Сохранение данных в приложение
+            self.load_data()
+            print(f"Данные импортированы из файла: {file_path}")
+        else:
+            print(f"Файл не найден: {file_path}")
+
+    @timed()
+    def merge_data(self, file_path):
+        """Добавление из файла техники и заметок, которых ещё нет."""
+        if os.path.exists(file_path):
+            report = self.ledger.merge_file(file_path)
+            self.load_data()
+            print(
+                f"Из файла {file_path} добавлено заметок: {report['notes']}, "
+                f"повторов пропущено: {report['duplicates']}, новая техника: {', '.join(report['techniques']) or 'нет'}"
+            )
         else:
             print(f"Файл не найден: {file_path}")
 
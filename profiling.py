@@ -0,0 +1,117 @@
+# Замеры времени и счетчики на самом устройстве, без подключения профилировщика.
+# Включаются переменной окружения TECHNIC_PROFILE=1 (или profiling.enable()),
+# выключенные замеры ничего не стоят: декоратор возвращает функцию как есть.
+# Пример:
+#     @timed("load_data")
+#     def load_data(self): ...
+#     with measure("storage.write"): ...
+#     count("widgets")
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+ENABLED = os.environ.get("TECHNIC_PROFILE", "") not in ("", "0")
+
+_lock = threading.Lock()  # Запись на диск идет в отдельном потоке
+_timings = {}  # имя -> [вызовов, всего секунд, наибольшее время]
+_counters = {}  # имя -> значение
+
+
+def enable(enabled=True):
+    """Включение замеров. Декораторы учитывают его только для функций, объявленных после."""
+    global ENABLED
+    ENABLED = enabled
+
+
+def record(name, seconds):
+    """Учет одного замера."""
+    with _lock:
+        timing = _timings.get(name)
+        if timing is None:
+            _timings[name] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+
+def count(name, value=1):
+    """Увеличение счетчика."""
+    if ENABLED:
+        with _lock:
+            _counters[name] = _counters.get(name, 0) + value
+
+
+@contextmanager
+def _measure(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def measure(name):
+    """Замер времени блока with."""
+    return _measure(name) if ENABLED else nullcontext()
+
+
+def timed(name=None):
+    """Декоратор замера времени каждого вызова функции."""
+    def decorator(func):
+        if not ENABLED:
+            return func
+        label = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(label, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """Текущие замеры: {"timings": {имя: {...}}, "counters": {...}}."""
+    with _lock:
+        timings = {
+            name: {"calls": calls, "total_ms": total * 1000, "avg_ms": total / calls * 1000, "max_ms": longest * 1000}
+            for name, (calls, total, longest) in _timings.items()
+        }
+        return {"timings": timings, "counters": dict(_counters)}
+
+
+def report():
+    """Замеры в виде строк текста, самые долгие первыми."""
+    data = snapshot()
+    lines = []
+    for name, timing in sorted(data["timings"].items(), key=lambda item: -item[1]["total_ms"]):
+        lines.append(
+            f"{name}: {timing['calls']} раз, всего {timing['total_ms']:.1f} мс, "
+            f"в среднем {timing['avg_ms']:.2f} мс, наибольшее {timing['max_ms']:.2f} мс"
+        )
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"{name}: {value}")
+    return lines
+
+
+def dump(path):
+    """Дописывание замеров в журнал (одна строка JSON на запись)."""
+    if not ENABLED:
+        return
+    line = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), **snapshot()}
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _counters.clear()
@@ -0,0 +1,97 @@
+# Поиск заметок по всей технике: период, набор техники, текст описания.
+# Индекс строится один раз и дальше обновляется при каждом изменении заметки.
+import re
+from bisect import bisect_left, bisect_right, insort
+
+TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Слова описания в нижнем регистре."""
+    return set(TOKEN.findall(text.lower()))
+
+
+class SearchIndex:
+    def __init__(self):
+        self.notes = {}  # id -> (техника, дата, описание, секунды)
+        self.dates = []  # (дата, id) по возрастанию
+        self.tokens = {}  # слово -> множество id заметок
+
+    def add(self, technique, note):
+        """Добавление заметки в индекс."""
+        self.notes[note.id] = (technique, note.date, note.description, note.seconds)
+        insort(self.dates, (note.date, note.id))
+        for token in tokenize(note.description):
+            self.tokens.setdefault(token, set()).add(note.id)
+
+    def build(self, notes):
+        """Заполнение пустого индекса из пар (техника, заметка-словарь) одной сортировкой."""
+        for technique, note in notes:
+            note_id = note["id"]
+            self.notes[note_id] = (technique, note["date"], note["description"], note["work_time"])
+            self.dates.append((note["date"], note_id))
+            for token in tokenize(note["description"]):
+                self.tokens.setdefault(token, set()).add(note_id)
+        self.dates.sort()
+
+    def remove(self, note_id):
+        """Удаление заметки из индекса."""
+        technique, date, description, seconds = self.notes.pop(note_id)
+        del self.dates[bisect_left(self.dates, (date, note_id))]
+        for token in tokenize(description):
+            ids = self.tokens[token]
+            ids.discard(note_id)
+            if not ids:
+                del self.tokens[token]
+
+    def update_seconds(self, note_id, seconds):
+        """Новое время работы заметки (дата и описание не меняются)."""
+        technique, date, description, _ = self.notes[note_id]
+        self.notes[note_id] = (technique, date, description, seconds)
+
+    def remove_technique(self, technique):
+        """Удаление из индекса всех заметок техники."""
+        for note_id in [note_id for note_id, note in self.notes.items() if note[0] == technique]:
+            self.remove(note_id)
+
+    def _text_ids(self, text):
+        """id заметок, в описании которых есть все слова запроса (или их части)."""
+        result = None
+        for word in tokenize(text):
+            ids = self.tokens.get(word)
+            if ids is None:
+                # Нет такого слова целиком - ищем его как часть слов
+                ids = set()
+                for token, token_ids in self.tokens.items():
+                    if word in token:
+                        ids |= token_ids
+            result = set(ids) if result is None else result & ids
+            if not result:
+                break
+        return result
+
+    def search(self, date_from=None, date_to=None, techniques=None, text=None):
+        """Заметки по условиям, отсортированные по дате.
+
+        Возвращает список (техника, id, дата, описание, секунды). Даты включительно.
+        """
+        start = bisect_left(self.dates, (date_from,)) if date_from else 0
+        end = bisect_right(self.dates, (date_to, float("inf"))) if date_to else len(self.dates)
+        text_ids = self._text_ids(text) if text and text.strip() else None
+        if text_ids is not None and len(text_ids) < end - start:
+            # Слов найдено меньше, чем заметок за период - перебираем их
+            keys = sorted((self.notes[note_id][1], note_id) for note_id in text_ids)
+            keys = [
+                key for key in keys
+                if (not date_from or key[0] >= date_from) and (not date_to or key[0] <= date_to)
+            ]
+        else:
+            keys = self.dates[start:end]
+            if text_ids is not None:
+                keys = [key for key in keys if key[1] in text_ids]
+        result = []
+        for date, note_id in keys:
+            technique, _, description, seconds = self.notes[note_id]
+            if techniques is None or technique in techniques:
+                result.append((technique, note_id, date, description, seconds))
+        return result
@@ -0,0 +1,105 @@
+# Сеансы работы техники: секундомеры с паузой, которые переживают перезапуск приложения.
+# Одновременно может идти по одному сеансу на каждую технику.
+# Пока приложение работает, время считается по time.monotonic (не зависит от перевода часов
+# и перехода через полночь). Для перезапуска сеанс сохраняется вместе с моментом
+# сохранения по обычным часам - других часов, общих для двух запусков, нет.
+import json
+import os
+import time
+from storage import atomic_open
+
+
+def format_elapsed(seconds):
+    """Время сеанса в виде ЧЧ:ММ:СС."""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+
+
+class Session:
+    def __init__(self, date, description="", elapsed=0.0):
+        self.date = date  # Дата заметки, которая получится из сеанса
+        self.description = description
+        self.elapsed = elapsed  # Секунды до последней паузы
+        self.running_since = None  # time.monotonic() последнего запуска, None - на паузе
+        self.started_at = None  # Время начала по часам, для отображения
+        self.ended_at = None  # Время окончания по часам
+        self.stopped = False
+
+    @property
+    def running(self):
+        return self.running_since is not None
+
+    def seconds(self):
+        """Время работы на текущий момент, секунды."""
+        if self.running_since is None:
+            return self.elapsed
+        return self.elapsed + time.monotonic() - self.running_since
+
+    def start(self):
+        """Запуск или продолжение после паузы."""
+        if self.running_since is None and not self.stopped:
+            self.running_since = time.monotonic()
+            if self.started_at is None:
+                self.started_at = time.time()
+
+    def pause(self):
+        if self.running_since is not None:
+            self.elapsed = self.seconds()
+            self.running_since = None
+
+    def stop(self):
+        """Окончание сеанса. Возвращает время работы, секунды."""
+        if self.stopped:
+            return self.elapsed
+        self.pause()
+        self.stopped = True
+        self.ended_at = time.time()
+        return self.elapsed
+
+    def to_dict(self):
+        return {
+            "date": self.date,
+            "description": self.description,
+            "elapsed": self.seconds(),
+            "running": self.running,
+            "started_at": self.started_at,
+            "ended_at": self.ended_at,
+            "saved_at": time.time(),
+            "stopped": self.stopped,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data["date"], data.get("description", ""), data["elapsed"])
+        session.started_at = data.get("started_at")
+        session.ended_at = data.get("ended_at")
+        session.stopped = data.get("stopped", False)
+        if data.get("running"):
+            # Время, пока приложение было закрыто, тоже рабочее
+            session.elapsed += max(time.time() - data["saved_at"], 0)
+            session.start()
+        return session
+
+
+def save_sessions(path, sessions):
+    """Сохранение всех сеансов {техника: сеанс} одной записью, пустой набор - удаление файла."""
+    if not sessions:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    data = {"sessions": {technique: session.to_dict() for technique, session in sessions.items()}}
+    with atomic_open(path) as file:
+        json.dump(data, file, ensure_ascii=False)
+
+
+def load_sessions(path):
+    """Сохраненные сеансы {техника: сеанс}."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        return {technique: Session.from_dict(session) for technique, session in data["sessions"].items()}
+    except (ValueError, KeyError) as error:
+        print(f"Не удалось восстановить сеансы: {error}")
+        return {}
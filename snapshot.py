@@ -0,0 +1,221 @@
+# Двоичный снимок данных: компактнее data.json и читается по частям через mmap.
+#
+# Устройство файла (все числа little-endian):
+#   заголовок      MAGIC, поколение, число техник, число заметок, число строк, смещение таблицы строк,
+#                  наибольший выданный id заметки (в версии 1 его нет),
+#                  смещение дополнительных разделов или 0 (в версиях 1 и 2 его нет)
+#   техника        (строка названия, первая заметка, число заметок) - по записи на технику
+#   заметки        (id, день, строка описания, секунды со знаком) - записи одной длины, заметки техники подряд
+#   таблица строк  смещения строк (число строк + 1), затем сами строки в UTF-8
+#   разделы        число разделов, затем (длина, байты) каждого - данные хранилища,
+#                  которые снимок хранит как есть (состояние синхронизации)
+# День - номер дня по григорианскому календарю (date.toordinal). Дата в неизвестном формате
+# хранится строкой, тогда в поле дня записан отрицательный номер строки: -(номер + 1).
+# Заметки одной техники находятся по таблице техники, поэтому их можно прочитать,
+# не разбирая остальной файл.
+import mmap
+import struct
+from datetime import date
+
+MAGIC = b"TNSNAP\x00\x03"
+MAGIC_V2 = b"TNSNAP\x00\x02"  # Без дополнительных разделов
+MAGIC_V1 = b"TNSNAP\x00\x01"  # Без наибольшего id, читается для старых файлов
+HEADER = struct.Struct("<8sQIIIQQQ")
+HEADER_V2 = struct.Struct("<8sQIIIQQ")
+HEADER_V1 = struct.Struct("<8sQIIIQ")
+TECHNIQUE = struct.Struct("<III")
+NOTE = struct.Struct("<qiIi")
+OFFSET = struct.Struct("<I")
+SECTION = struct.Struct("<Q")
+
+
+def is_snapshot(path):
+    """Записан ли файл в формате двоичного снимка."""
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) in (MAGIC, MAGIC_V2, MAGIC_V1)
+
+
+def write_snapshot(file, techniques, load_notes, generation=0, last_id=0, sections=()):
+    """Запись снимка в открытый двоичный файл.
+
+    load_notes(техника) возвращает заметки техники, в памяти одновременно
+    заметки только одной техники и таблица различных строк.
+    last_id - наибольший выданный id, он сохраняется, даже если заметки с ним уже нет.
+    sections - дополнительные разделы (bytes), читаются обратно через Snapshot.section.
+    """
+    strings = {}  # строка -> номер
+    ordinals = {}  # дата -> номер дня или -(номер строки + 1)
+
+    def string(text):
+        index = strings.get(text)
+        if index is None:
+            index = strings[text] = len(strings)
+        return index
+
+    def day(text):
+        value = ordinals.get(text)
+        if value is None:
+            try:
+                value = date.fromisoformat(text).toordinal()
+                if date.fromordinal(value).isoformat() != text:
+                    raise ValueError(text)  # "2024-1-5" и т.п. храним как есть
+            except ValueError:
+                value = -(string(text) + 1)
+            ordinals[text] = value
+        return value
+
+    start = file.tell()
+    table_size = TECHNIQUE.size * len(techniques)
+    file.write(b"\x00" * (HEADER.size + table_size))  # Заполняется в конце
+    table = []
+    count = 0
+    for technique in techniques:
+        name = string(technique)
+        first = count
+        records = bytearray()
+        for note in load_notes(technique):
+            note_id = note.get("id") or 0
+            last_id = max(last_id, note_id)
+            records += NOTE.pack(note_id, day(note["date"]), string(note["description"]), note["work_time"])
+            count += 1
+        file.write(records)
+        table.append(TECHNIQUE.pack(name, first, count - first))
+
+    strings_offset = file.tell() - start
+    encoded = [text.encode("utf-8") for text in strings]
+    offsets = bytearray()
+    position = 0
+    for data in encoded:
+        offsets += OFFSET.pack(position)
+        position += len(data)
+    offsets += OFFSET.pack(position)
+    file.write(offsets)
+    file.write(b"".join(encoded))
+
+    sections_offset = 0
+    if sections:
+        sections_offset = file.tell() - start
+        file.write(SECTION.pack(len(sections)))
+        for section in sections:
+            file.write(SECTION.pack(len(section)))
+            file.write(section)
+
+    end = file.tell()
+    file.seek(start)
+    file.write(HEADER.pack(
+        MAGIC, generation, len(techniques), count, len(strings), strings_offset, last_id, sections_offset
+    ))
+    file.write(b"".join(table))
+    file.seek(end)
+
+
+class Snapshot:
+    """Чтение двоичного снимка через mmap.
+
+    Строки и даты разбираются при первом обращении и дальше берутся из кэша,
+    поэтому одинаковые описания у разных заметок - один и тот же объект str.
+    """
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = self.map[:len(MAGIC)]
+        self.sections_offset = 0
+        if magic == MAGIC:
+            header = HEADER
+            magic, self.generation, technique_count, self.count, string_count, strings_offset, self.last_id, \
+                self.sections_offset = HEADER.unpack_from(self.map, 0)
+        elif magic == MAGIC_V2:
+            header = HEADER_V2
+            magic, self.generation, technique_count, self.count, string_count, strings_offset, self.last_id = \
+                HEADER_V2.unpack_from(self.map, 0)
+        elif magic == MAGIC_V1:
+            header = HEADER_V1
+            magic, self.generation, technique_count, self.count, string_count, strings_offset = \
+                HEADER_V1.unpack_from(self.map, 0)
+            self.last_id = None
+        else:
+            self.close()
+            raise ValueError(f"Файл не является снимком данных: {path}")
+        self.strings_offset = strings_offset
+        self.text_offset = strings_offset + OFFSET.size * (string_count + 1)
+        self.notes_offset = header.size + TECHNIQUE.size * technique_count
+        self.strings = {}  # номер -> строка
+        self.dates = {}  # день -> "ГГГГ-ММ-ДД"
+        self.ranges = {}  # техника -> (первая заметка, число заметок)
+        self.techniques = []
+        for name, first, size in TECHNIQUE.iter_unpack(self.map[header.size:self.notes_offset]):
+            technique = self.string(name)
+            self.techniques.append(technique)
+            self.ranges[technique] = (first, size)
+        if self.last_id is None:
+            notes = self.map[self.notes_offset:self.notes_offset + NOTE.size * self.count]
+            self.last_id = max((note_id for note_id, _, _, _ in NOTE.iter_unpack(notes)), default=0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def string(self, index):
+        text = self.strings.get(index)
+        if text is None:
+            offset = self.strings_offset + OFFSET.size * index
+            begin, end = struct.unpack_from("<II", self.map, offset)
+            text = self.strings[index] = self.map[self.text_offset + begin:self.text_offset + end].decode("utf-8")
+        return text
+
+    def section(self, index):
+        """Дополнительный раздел с номером index (bytes), None - его нет."""
+        if not self.sections_offset:
+            return None
+        offset = self.sections_offset
+        (count,) = SECTION.unpack_from(self.map, offset)
+        if index >= count:
+            return None
+        offset += SECTION.size
+        for _ in range(index):
+            (size,) = SECTION.unpack_from(self.map, offset)
+            offset += SECTION.size + size
+        (size,) = SECTION.unpack_from(self.map, offset)
+        offset += SECTION.size
+        return self.map[offset:offset + size]
+
+    def date(self, day):
+        text = self.dates.get(day)
+        if text is None:
+            text = self.dates[day] = date.fromordinal(day).isoformat() if day > 0 else self.string(-day - 1)
+        return text
+
+    def _records(self, technique):
+        """Записи заметок техники: (id, день, строка описания, секунды)."""
+        first, size = self.ranges.get(technique, (0, 0))
+        begin = self.notes_offset + NOTE.size * first
+        return NOTE.iter_unpack(self.map[begin:begin + NOTE.size * size])
+
+    def notes(self, technique):
+        """Заметки одной техники, остальной файл не читается."""
+        return [
+            {"id": note_id or None, "date": self.date(day), "description": self.string(description),
+             "work_time": seconds}
+            for note_id, day, description, seconds in self._records(technique)
+        ]
+
+    def days(self, technique):
+        """Время работы техники по дням без чтения описаний."""
+        days = {}
+        for _, day, _, seconds in self._records(technique):
+            text = self.date(day)
+            days[text] = days.get(text, 0) + seconds
+        return days
+
+    def iter_notes(self):
+        """Все заметки по одной: (техника, заметка)."""
+        for technique in self.techniques:
+            for note in self.notes(technique):
+                yield technique, note
@@ -0,0 +1,1295 @@
+# Хранение данных.
+# JournalStorage - снимок data.json + журнал изменений data.journal:
+# каждое изменение дописывается в журнал одной короткой строкой,
+# периодически журнал сворачивается обратно в снимок.
+# Снимок может быть и двоичным (data.snap, см. snapshot.py), формат определяется при чтении.
+# SqliteStorage - база data.db с индексом по (технике, дате).
+# Оба хранилища принимают одни и те же записи изменений (см. apply_record)
+# и умеют отдавать список техники с итогами по дням отдельно от заметок,
+# чтобы заметки загружались только для выбранной техники.
+# Для синхронизации (см. sync.py) хранилища сами отмечают заметки, измененные после
+# прошлой синхронизации, и хранят uid с версией каждой заметки (запись "sync").
+# BackgroundStorage - обертка, которая пишет изменения в отдельном потоке.
+import os
+import heapq
+import json
+import queue
+from bisect import bisect_left
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from snapshot import Snapshot, is_snapshot, write_snapshot
+import profiling
+
+COMPACT_EVERY = 500  # Сколько записей журнала копить до сворачивания в снимок
+WRITE_DELAY = 0.5  # Сколько секунд собирать изменения перед записью в фоне
+FOOTER = "\n#crc32:"  # Последняя строка снимка: контрольная сумма всего, что перед ней
+FOOTER_SIZE = len(FOOTER) + 9  # + 8 цифр суммы и перевод строки
+SQL_VARIABLES = 500  # Параметров в одном запросе (старые версии SQLite - не больше 999)
+
+
+def file_checksum(path, size=None):
+    """CRC32 первых size байт файла (всего файла, если size не задан)."""
+    checksum = 0
+    with open(path, "rb") as file:
+        left = os.path.getsize(path) if size is None else size
+        while left > 0:
+            chunk = file.read(min(left, 1 << 20))
+            if not chunk:
+                break
+            checksum = zlib.crc32(chunk, checksum)
+            left -= len(chunk)
+    return checksum
+
+
+def checked_size(path):
+    """Размер содержимого снимка без строки контрольной суммы.
+
+    Сумма сверяется без разбора содержимого. Файл без суммы (записанный
+    старой версией) принимается целиком, неверная сумма - ValueError.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        file.seek(max(size - FOOTER_SIZE, 0))
+        footer = file.read().decode("ascii", "replace")
+    if not footer.startswith(FOOTER) or len(footer) != FOOTER_SIZE:
+        return size
+    size -= FOOTER_SIZE
+    if file_checksum(path, size) != int(footer[len(FOOTER):-1], 16):
+        raise ValueError("контрольная сумма не совпадает")
+    return size
+
+
+def sync_dir(path):
+    """Запись на диск самого переименования файла (где это поддерживается)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path or ".", os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_open(path, mode="w", checksum=False, backup=False):
+    """Файл для записи, который заменяет path только после полной записи на диск.
+
+    checksum=True - в конец дописывается строка с контрольной суммой (см. checked_size),
+    backup=True - прежний файл остается рядом как path.bak.
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, mode, encoding=None if "b" in mode else "utf-8") as file:
+            yield file
+            if checksum:
+                file.flush()
+                footer = f"{FOOTER}{file_checksum(tmp_path):08x}\n"
+                file.write(footer.encode("ascii") if "b" in mode else footer)
+            file.flush()
+            os.fsync(file.fileno())
+            if profiling.ENABLED:
+                profiling.count("bytes_written", file.tell())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)  # Недописанный файл не оставляем
+        raise
+    if backup and os.path.exists(path):
+        os.replace(path, path + ".bak")
+    os.replace(tmp_path, path)
+    sync_dir(os.path.dirname(path))
+
+
+def empty_data():
+    """Пустые данные в формате data.json."""
+    return {"techniques": [], "notes": {}}
+
+
+def iter_data_notes(data):
+    """Пары (техника, заметка) из данных в формате data.json."""
+    for technique, notes in data["notes"].items():
+        for note in notes:
+            yield technique, note
+
+
+def note_position(notes, record):
+    """Номер заметки из записи изменения в списке техники.
+
+    Заметки идут по возрастанию id, поэтому поиск двоичный.
+    Старые записи журнала ссылаются на заметку по номеру ("index").
+    """
+    if "id" not in record:
+        return record["index"]
+    position = bisect_left(notes, record["id"], key=lambda note: note["id"])
+    if position == len(notes) or notes[position]["id"] != record["id"]:
+        raise KeyError(record["id"])
+    return position
+
+
+def apply_record(data, record):
+    """Применение одной записи журнала к данным."""
+    op = record["op"]
+    technique = record.get("technique")
+    notes = data["notes"]
+    if op == "add_technique":
+        if technique not in data["techniques"]:
+            data["techniques"].append(technique)
+        notes.setdefault(technique, [])
+    elif op == "delete_technique":
+        if technique in data["techniques"]:
+            data["techniques"].remove(technique)
+        notes.pop(technique, None)
+    elif op == "add_note":
+        notes.setdefault(technique, []).append(record["note"])
+    elif op in ("edit_note", "delete_note"):
+        technique_notes = notes.get(technique, [])
+        try:
+            position = note_position(technique_notes, record)
+            note = technique_notes[position]
+        except (KeyError, IndexError):
+            # Как UPDATE и DELETE в SQLite: заметки уже нет, запись ничего не меняет,
+            # а журнал со старой записью все равно загружается
+            print(f"Пропущена запись журнала для отсутствующей заметки: {record}")
+            return
+        if op == "edit_note":
+            note.update(record["fields"])
+        else:
+            del technique_notes[position]
+
+
+def read_json(path):
+    """Данные JSON из файла, контрольная сумма (если есть) проверяется."""
+    size = checked_size(path)
+    with open(path, "rb") as file:
+        return json.loads(file.read(size))
+
+
+class JournalStorage:
+    def __init__(self, data_dir, compact_every=COMPACT_EVERY, binary=False, read_only=False):
+        # binary=True - снимок пишется в двоичном формате (data.snap) вместо data.json
+        # read_only=True - файлы только читаются: журнал не обрезается, снимок не переписывается
+        json_path = os.path.join(data_dir, "data.json")
+        binary_path = os.path.join(data_dir, "data.snap")
+        self.snapshot_path, self.other_path = (binary_path, json_path) if binary else (json_path, binary_path)
+        self.binary = binary
+        self.read_only = read_only
+        self.journal_path = os.path.join(data_dir, "data.journal")
+        self.compact_every = compact_every
+        self.is_new = False  # Перенос данных не нужен - это и есть исходный формат
+        self.generation = 0  # Номер снимка, к которому относится журнал
+        self.journal_size = 0  # Записей, ещё не свёрнутых в снимок
+        self.last_id = 0  # Наибольший выданный id заметки, id удаленных заметок не повторяются
+        self.data = empty_data()  # Текущее состояние: снимок + журнал
+        # Двоичный снимок остается открытым, заметки техники читаются из него при первом запросе
+        self.snapshot = None
+        self.unloaded = set()  # Техника, заметки которой еще только в снимке
+        self.pending = {}  # техника -> записи журнала для ее заметок, пока они в снимке
+        # Синхронизация: отметки измененных заметок и uid с версией каждой заметки
+        self.sync_seq = 0  # Номер последней отметки
+        self.sync_marks = {}  # id заметки -> [номер отметки, техника]
+        self.sync_unmarked = False  # Снимок без отметок: отметить все его заметки (номер 0)
+        self.sync_base = None  # Состояние синхронизации из снимка JSON
+        self.sync_notes = None  # id заметки -> [uid, счетчик, устройство, техника], None - еще в снимке
+
+    def load(self):
+        """Загрузка снимка и применение к нему журнала, все заметки - в self.data."""
+        data = self._load()
+        self._load_all()
+        return data
+
+    def _load_all(self):
+        """Чтение в память всех заметок, еще оставшихся в снимке."""
+        for technique in list(self.unloaded):
+            self.load_notes(technique)
+
+    def _load(self):
+        """Загрузка снимка и журнала. Заметки двоичного снимка остаются в нем до load_notes."""
+        self._close_snapshot()
+        data = self.data = empty_data()
+        self.generation = 0
+        self.journal_size = 0
+        snapshot, damaged = self._read_snapshot()
+        recovered = bool(damaged)
+        if not self.read_only:
+            for path in damaged:
+                # Испорченный файл не должен попасть в .bak на место целой копии при compact
+                os.replace(path, path + ".corrupt")
+        if snapshot:
+            data["techniques"] = snapshot["techniques"]
+            data["notes"] = snapshot["notes"]
+            self.generation = snapshot.get("generation", 0)
+            self.snapshot = snapshot.get("snapshot")
+            if self.snapshot:
+                self.unloaded = set(data["techniques"])
+        self.sync_base = snapshot.get("sync") if snapshot else None
+        self.sync_notes = None
+        marks = self._sync_base(0)
+        self.sync_seq = marks["seq"] if marks else 0
+        self.sync_marks = {note_id: [seq, technique] for note_id, seq, technique in marks["changes"]} \
+            if marks else {}
+        # Данные до появления синхронизации еще ни разу не отправлялись
+        self.sync_unmarked = marks is None
+        # Снимок старой версии без last_id - по заметкам
+        self.last_id = snapshot.get("last_id") if snapshot and "last_id" in snapshot else self._max_id()
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, "rb") as file:
+                header = file.readline()
+                try:
+                    header_data = json.loads(header)
+                    generation = header_data.get("generation")
+                    # После отката к копии снимка id потерянного поколения не выдаются снова
+                    self.last_id = max(self.last_id, header_data.get("last_id", 0))
+                except ValueError:
+                    generation = None
+                good_size = file.tell()  # Конец последней целой записи
+                # Журнал от старого снимка уже учтён в текущем снимке
+                if generation == self.generation and header.endswith(b"\n"):
+                    for line in file:
+                        try:
+                            if not line.endswith(b"\n"):
+                                raise ValueError("запись не дописана")
+                            record = json.loads(line)
+                        except ValueError:
+                            break  # Последняя строка могла не дописаться
+                        self._apply(record)
+                        self.journal_size += 1
+                        good_size += len(line)
+                else:
+                    good_size = None
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                            if record["op"] == "add_note":
+                                self.last_id = max(self.last_id, record["note"].get("id") or 0)
+                        except (ValueError, KeyError):
+                            break
+            if self.read_only:
+                pass
+            elif good_size is None:
+                self._start_journal()  # Новые записи не должны попасть в журнал чужого снимка
+            elif good_size < os.path.getsize(self.journal_path):
+                # Обрывок записи убираем, иначе следующая запись склеится с ним и потеряется
+                os.truncate(self.journal_path, good_size)
+        if (self._assign_ids() or recovered) and not self.read_only:
+            # Сразу сохраняем id, чтобы новые записи журнала на них ссылались.
+            # После восстановления из копии журнал от испорченного снимка не подходит к ней,
+            # поэтому начинаем новый.
+            self.compact()
+        return data
+
+    def _read_snapshot(self):
+        """Последний целый снимок: (снимок или None, испорченные файлы перед ним).
+
+        Снимок другого формата остается, пока хранилище не свернет журнал в свой.
+        """
+        paths = [self.snapshot_path, self.snapshot_path + ".bak", self.other_path, self.other_path + ".bak"]
+        damaged = []
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            try:
+                if is_snapshot(path):
+                    checked_size(path)
+                    snapshot = Snapshot(path)
+                    return {
+                        "generation": snapshot.generation,
+                        "last_id": snapshot.last_id,
+                        "techniques": list(snapshot.techniques),
+                        "notes": {},
+                        "snapshot": snapshot,
+                    }, damaged
+                return read_json(path), damaged
+            except (OSError, ValueError, KeyError, struct.error) as error:
+                print(f"Снимок данных {path} поврежден ({error}), берется предыдущий")
+                damaged.append(path)
+        return None, damaged
+
+    def _apply(self, record):
+        """Применение записи журнала к данным в памяти."""
+        op = record["op"]
+        if op == "sync":
+            self._apply_sync(record)
+            return
+        if op == "add_note":
+            self.last_id = max(self.last_id, record["note"].get("id") or 0)
+        technique = record.get("technique")
+        if op in ("add_note", "edit_note", "delete_note"):
+            self._mark(record["note"].get("id") if op == "add_note" else record.get("id"), technique)
+        elif op == "delete_technique":
+            for note in self._peek_notes(technique):
+                self._mark(note["id"], technique)
+        if technique in self.unloaded:
+            if op == "delete_technique":
+                self.unloaded.discard(technique)
+                self.pending.pop(technique, None)
+            elif op != "add_technique":
+                self.pending.setdefault(technique, []).append(record)
+                return  # Применится, когда заметки будут прочитаны из снимка
+        apply_record(self.data, record)
+
+    def _mark(self, note_id, technique):
+        """Отметка заметки, измененной после синхронизации."""
+        if note_id is not None:
+            self.sync_seq += 1
+            self.sync_marks[note_id] = [self.sync_seq, technique]
+
+    def _sync_base(self, index):
+        """Часть состояния синхронизации из снимка: 0 - отметки, 1 - заметки; None - ее нет."""
+        if self.snapshot:
+            section = self.snapshot.section(index)
+            return None if section is None else json.loads(section)
+        return self.sync_base[index] if self.sync_base else None
+
+    def _marks(self):
+        """Все отметки: id заметки -> [номер отметки, техника]."""
+        if self.sync_unmarked:
+            for technique, note in self.iter_notes():
+                self.sync_marks.setdefault(note["id"], [0, technique])
+            self.sync_unmarked = False
+        return self.sync_marks
+
+    def _sync_entries(self):
+        """uid и версии заметок: при первом обращении читаются из снимка."""
+        if self.sync_notes is None:
+            self.sync_notes = {row[0]: row[1:] for row in self._sync_base(1) or ()}
+        return self.sync_notes
+
+    def _sync_data(self, index):
+        """Часть состояния синхронизации для записи в снимок."""
+        if index == 0:
+            marks = self._marks()
+            return {"seq": self.sync_seq, "changes": [[note_id] + mark for note_id, mark in marks.items()]}
+        return [[note_id] + entry for note_id, entry in self._sync_entries().items()]
+
+    def _apply_sync(self, record):
+        """Запись "sync": uid и версии заметок после обмена, снятие отметок отправленного и полученного."""
+        if record["notes"]:
+            entries = self._sync_entries()
+            for note_id, entry in record["notes"]:
+                if entry:
+                    entries[note_id] = entry
+                else:
+                    entries.pop(note_id, None)
+        marks = self._marks()
+        if "done" in record:
+            for note_id in [note_id for note_id, (seq, _) in marks.items() if seq <= record["done"]]:
+                del marks[note_id]
+        for note_id in record.get("received", ()):
+            marks.pop(note_id, None)
+
+    def sync_changes(self):
+        """Заметки, измененные после синхронизации: (номер отметки, id, техника, заметка).
+
+        У удаленной заметки техника и заметка - None.
+        """
+        found = {}  # техника -> заметки
+        rows = []
+        for note_id, (seq, technique) in sorted(self._marks().items(), key=lambda item: item[1][0]):
+            notes = found.get(technique)
+            if notes is None:
+                notes = found[technique] = self._peek_notes(technique)
+            try:
+                rows.append((seq, note_id, technique, notes[note_position(notes, {"id": note_id})]))
+            except KeyError:
+                rows.append((seq, note_id, None, None))
+        return rows
+
+    def sync_entries(self, note_ids=(), uids=(), technique=None):
+        """uid и версии заметок: id -> [uid, счетчик, устройство, техника].
+
+        Отбираются заметки с id из note_ids, с uid из uids и все заметки техники technique.
+        """
+        uids = set(uids)
+        if not note_ids and not uids and technique is None:
+            return {}
+        notes = self._sync_entries()
+        entries = {note_id: notes[note_id] for note_id in note_ids if note_id in notes}
+        if uids or technique is not None:
+            entries.update(
+                (note_id, entry) for note_id, entry in notes.items() if entry[0] in uids or entry[3] == technique
+            )
+        return entries
+
+    def _close_snapshot(self):
+        if self.snapshot:
+            self.snapshot.close()
+        self.snapshot = None
+        self.unloaded = set()
+        self.pending = {}
+
+    def _peek_notes(self, technique):
+        """Заметки техники без сохранения в self.data (для обхода всех заметок)."""
+        if technique not in self.unloaded:
+            return self.data["notes"].get(technique, [])
+        notes = self.snapshot.notes(technique)
+        if technique in self.pending:
+            data = {"techniques": [technique], "notes": {technique: notes}}
+            for record in self.pending[technique]:
+                apply_record(data, record)
+        return notes
+
+    def _assign_ids(self):
+        """Выдача id заметкам, у которых его нет (данные старых версий)."""
+        assigned = False
+        for _, note in iter_data_notes(self.data):
+            if note.get("id") is None:
+                self.last_id += 1
+                note["id"] = self.last_id
+                assigned = True
+        return assigned
+
+    def _max_id(self):
+        return max((note.get("id") or 0 for _, note in iter_data_notes(self.data)), default=0)
+
+    def max_note_id(self):
+        return self.last_id
+
+    def load_index(self):
+        """Список техники и время работы по дням.
+
+        Снимок JSON нельзя прочитать частично, поэтому он разбирается целиком,
+        но заметки остаются словарями до запроса load_notes. Из двоичного снимка
+        итоги по дням читаются без описаний, заметки - только для техники,
+        которую менял журнал.
+        """
+        data = self._load()
+        days = {}
+        for technique in data["techniques"]:
+            if technique in self.unloaded and technique not in self.pending:
+                days[technique] = self.snapshot.days(technique)
+                continue
+            technique_days = days[technique] = {}
+            for note in self.load_notes(technique):
+                technique_days[note["date"]] = technique_days.get(note["date"], 0) + note["work_time"]
+        return {"techniques": list(data["techniques"]), "days": days}
+
+    def load_notes(self, technique):
+        """Заметки одной техники."""
+        if technique in self.unloaded:
+            self.data["notes"][technique] = self._peek_notes(technique)
+            self.unloaded.discard(technique)
+            self.pending.pop(technique, None)
+        return self.data["notes"].get(technique, [])
+
+    def get_note(self, technique, note_id):
+        """Заметка техники по id, None - такой нет."""
+        notes = self.load_notes(technique)
+        try:
+            return notes[note_position(notes, {"id": note_id})]
+        except KeyError:
+            return None
+
+    def query_notes(self, technique, date_from=None, date_to=None):
+        """Заметки техники за период (даты включительно)."""
+        date_from = date_from or ""
+        date_to = date_to or "9999"
+        notes = [note for note in self.load_notes(technique) if date_from <= note["date"] <= date_to]
+        notes.sort(key=lambda note: note["date"])
+        return notes
+
+    def page_notes(self, technique, before, limit):
+        """Страница заметок техники от новых к старым, старше курсора before = (дата, id).
+
+        Заметки и так в памяти, поэтому отбираются limit наибольших без сортировки всех.
+        """
+        notes = self.load_notes(technique)
+        if before:
+            before = tuple(before)
+            notes = (note for note in notes if (note["date"], note["id"]) < before)
+        return heapq.nlargest(limit, notes, key=lambda note: (note["date"], note["id"]))
+
+    def iter_rows(self, techniques=None, date_from=None, date_to=None):
+        """Строки (техника, id, дата, описание, секунды) по технике, затем по дате."""
+        date_from = date_from or ""
+        date_to = date_to or "9999"
+        for technique in self.data["techniques"] if techniques is None else techniques:
+            rows = [
+                (technique, note["id"], note["date"], note["description"], note["work_time"])
+                for note in self._peek_notes(technique) if date_from <= note["date"] <= date_to
+            ]
+            rows.sort(key=lambda row: (row[2], row[1]))
+            yield from rows
+
+    def append(self, record):
+        """Дописывание одной записи в журнал."""
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Дописывание набора записей в журнал за одно открытие файла."""
+        if not os.path.exists(self.journal_path):
+            self._start_journal()
+        records = list(records)
+        text = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with open(self.journal_path, "a", encoding="utf-8") as file:
+            size = file.tell()
+            try:
+                file.write(text)
+                file.flush()
+            except OSError:
+                file.truncate(size)  # Набор не записан вовсе, его можно повторить целиком
+                raise
+        if profiling.ENABLED:
+            profiling.count("bytes_written", len(text.encode("utf-8")))
+        for record in records:
+            self._apply(record)
+            self.journal_size += 1
+        if self.journal_size >= self.compact_every:
+            try:
+                self.compact()
+            except OSError as error:
+                # Записи уже в журнале: свертка повторится при следующей записи
+                print(f"Ошибка свертки журнала: {error}")
+
+    def count_notes(self):
+        count = sum(len(notes) for technique, notes in self.data["notes"].items() if technique not in self.unloaded)
+        for technique in self.unloaded:
+            count += len(self._peek_notes(technique)) if technique in self.pending else \
+                self.snapshot.ranges[technique][1]
+        return count
+
+    def iter_notes(self):
+        """Все заметки по одной: (техника, заметка)."""
+        if not self.snapshot:
+            return iter_data_notes(self.data)
+        return (
+            (technique, note)
+            for technique in list(self.data["techniques"])
+            for note in self._peek_notes(technique)
+        )
+
+    def replace(self, data):
+        """Полная замена данных (импорт, перенос)."""
+        self._sync_entries()  # Дальше снимка не будет
+        for technique, note in list(self.iter_notes()):
+            self._mark(note["id"], technique)
+        self.sync_unmarked = False
+        self._close_snapshot()
+        self.data = data
+        self.last_id = max(self.last_id, self._max_id())
+        self._assign_ids()
+        for technique, note in iter_data_notes(data):
+            self._mark(note["id"], technique)
+        self.compact()
+
+    def replace_stream(self, techniques, notes):
+        """Полная замена данных из потока (техника, заметка).
+
+        Снимок JSON пишется целиком, поэтому данные всё равно собираются в памяти.
+        """
+        data = {"techniques": list(techniques), "notes": {technique: [] for technique in techniques}}
+        for technique, note in notes:
+            data["notes"].setdefault(technique, []).append(note)
+        self.replace(data)
+
+    @profiling.timed("storage.compact")
+    def compact(self):
+        """Запись полного снимка и начало нового журнала."""
+        generation = self.generation + 1  # Меняется только после записи снимка
+        if self.binary:
+            sections = [json.dumps(self._sync_data(0), ensure_ascii=False).encode("utf-8")]
+            # uid и версии, которые не читались, переписываются без разбора
+            section = self.snapshot.section(1) if self.snapshot and self.sync_notes is None else None
+            sections.append(section if section is not None else
+                            json.dumps(self._sync_data(1), ensure_ascii=False).encode("utf-8"))
+            with atomic_open(self.snapshot_path, "wb", checksum=True, backup=True) as file:
+                write_snapshot(file, self.data["techniques"], self._peek_notes, generation, self.last_id, sections)
+            # Заметки снова читаются из нового снимка, в памяти их не держим
+            self._close_snapshot()
+            self.data["notes"] = {}
+            self.snapshot = Snapshot(self.snapshot_path)
+            self.unloaded = set(self.data["techniques"])
+        else:
+            self._load_all()  # Снимок JSON пишется целиком
+            sync = [self._sync_data(0), self._sync_data(1)]
+            self._close_snapshot()
+            snapshot = {
+                "generation": generation,
+                "last_id": self.last_id,
+                "techniques": self.data["techniques"],
+                "notes": self.data["notes"],
+                "sync": sync,
+            }
+            with atomic_open(self.snapshot_path, checksum=True, backup=True) as file:
+                json.dump(snapshot, file, ensure_ascii=False)
+        self.generation = generation
+        for path in (self.other_path, self.other_path + ".bak"):
+            if os.path.exists(path):
+                os.remove(path)  # Журнал теперь относится к новому снимку
+        self._start_journal()
+
+    def _start_journal(self):
+        """Новый журнал с заголовком: поколение текущего снимка и наибольший выданный id."""
+        with open(self.journal_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps({"generation": self.generation, "last_id": self.last_id}) + "\n")
+        self.journal_size = 0
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Сворачивание журнала при закрытии."""
+        if self.journal_size and not self.read_only:
+            self.compact()
+        self._close_snapshot()
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS techniques (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY,
+    technique TEXT NOT NULL,
+    date TEXT NOT NULL,
+    description TEXT NOT NULL,
+    work_time INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_technique_date ON notes (technique, date);
+-- Наибольший выданный id заметки (без AUTOINCREMENT SQLite снова выдал бы id удаленной последней)
+-- и отметка о законченном переносе данных ('migrated')
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS notes_last_id AFTER INSERT ON notes BEGIN
+    INSERT INTO counters (name, value) VALUES ('last_note_id', NEW.id)
+    ON CONFLICT (name) DO UPDATE SET value = MAX(value, NEW.id);
+END;
+-- Итоги по дням, чтобы при запуске не читать сами заметки
+CREATE TABLE IF NOT EXISTS day_totals (
+    technique TEXT NOT NULL,
+    date TEXT NOT NULL,
+    work_time INTEGER NOT NULL,
+    PRIMARY KEY (technique, date)
+);
+CREATE TRIGGER IF NOT EXISTS notes_insert AFTER INSERT ON notes BEGIN
+    INSERT INTO day_totals (technique, date, work_time) VALUES (NEW.technique, NEW.date, NEW.work_time)
+    ON CONFLICT (technique, date) DO UPDATE SET work_time = work_time + NEW.work_time;
+END;
+CREATE TRIGGER IF NOT EXISTS notes_delete AFTER DELETE ON notes BEGIN
+    UPDATE day_totals SET work_time = work_time - OLD.work_time
+    WHERE technique = OLD.technique AND date = OLD.date;
+END;
+CREATE TRIGGER IF NOT EXISTS notes_update AFTER UPDATE ON notes BEGIN
+    UPDATE day_totals SET work_time = work_time - OLD.work_time
+    WHERE technique = OLD.technique AND date = OLD.date;
+    INSERT INTO day_totals (technique, date, work_time) VALUES (NEW.technique, NEW.date, NEW.work_time)
+    ON CONFLICT (technique, date) DO UPDATE SET work_time = work_time + NEW.work_time;
+END;
+-- Синхронизация: uid и версия каждой заметки на устройстве
+CREATE TABLE IF NOT EXISTS sync_notes (
+    id INTEGER PRIMARY KEY,
+    uid TEXT NOT NULL UNIQUE,
+    counter INTEGER NOT NULL,
+    device TEXT NOT NULL,
+    technique TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sync_notes_technique ON sync_notes (technique);
+-- Заметки, измененные после прошлой синхронизации; seq растет с каждой отметкой
+CREATE TABLE IF NOT EXISTS sync_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id INTEGER NOT NULL UNIQUE
+);
+CREATE TRIGGER IF NOT EXISTS notes_sync_insert AFTER INSERT ON notes BEGIN
+    INSERT OR REPLACE INTO sync_changes (id) VALUES (NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_sync_update AFTER UPDATE ON notes BEGIN
+    INSERT OR REPLACE INTO sync_changes (id) VALUES (NEW.id);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_sync_delete AFTER DELETE ON notes BEGIN
+    INSERT OR REPLACE INTO sync_changes (id) VALUES (OLD.id);
+END;
+"""
+
+NOTE_FIELDS = ("date", "description", "work_time")
+NOTE_COLUMNS = "id, date, description, work_time"
+
+
+def note_from_row(row):
+    """Заметка из строки (id, date, description, work_time)."""
+    note_id, date, description, work_time = row
+    return {"id": note_id, "date": date, "description": description, "work_time": work_time}
+
+
+class SqliteStorage:
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.is_new = False  # Нужен перенос data.json и старых .txt
+        self.journal_size = 0  # Каждое изменение сразу попадает в базу
+        if read_only:
+            # Для анализа: база не создается и схема не дополняется
+            self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            return
+        # Соединение может использоваться из потока BackgroundStorage (под его блокировкой)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        has_sync = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sync_changes'"
+        ).fetchone()
+        self.connection.executescript(SCHEMA)
+        if not has_sync:
+            with self.connection:  # Заметки до появления синхронизации еще ни разу не отправлялись
+                self.connection.execute("INSERT INTO sync_changes (id) SELECT id FROM notes ORDER BY id")
+        # Файл базы появляется раньше, чем закончится перенос, поэтому смотрим на отметку,
+        # которую replace записывает вместе с данными
+        if not self.connection.execute("SELECT 1 FROM counters WHERE name = 'migrated'").fetchone():
+            if self.connection.execute("SELECT 1 FROM techniques LIMIT 1").fetchone():
+                with self.connection:  # База с данными, созданная до отметки
+                    self.connection.execute("INSERT INTO counters (name, value) VALUES ('migrated', 1)")
+            else:
+                self.is_new = True
+        # База без итогов по дням (создана до их появления) - считаем один раз
+        if not self.connection.execute("SELECT 1 FROM day_totals LIMIT 1").fetchone():
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO day_totals (technique, date, work_time) "
+                    "SELECT technique, date, SUM(work_time) FROM notes GROUP BY technique, date"
+                )
+
+    def load_index(self):
+        """Список техники и время работы по дням без чтения заметок."""
+        techniques = [name for (name,) in self.connection.execute("SELECT name FROM techniques ORDER BY id")]
+        days = {}
+        for technique, date, work_time in self.connection.execute(
+            "SELECT technique, date, work_time FROM day_totals WHERE work_time != 0"
+        ):
+            days.setdefault(technique, {})[date] = work_time
+        return {"techniques": techniques, "days": days}
+
+    def load_notes(self, technique):
+        """Заметки одной техники."""
+        rows = self.connection.execute(
+            f"SELECT {NOTE_COLUMNS} FROM notes WHERE technique = ? ORDER BY id",
+            (technique,)
+        )
+        return [note_from_row(row) for row in rows]
+
+    def get_note(self, technique, note_id):
+        """Заметка техники по id, None - такой нет."""
+        row = self.connection.execute(
+            f"SELECT {NOTE_COLUMNS} FROM notes WHERE id = ? AND technique = ?", (note_id, technique)
+        ).fetchone()
+        return note_from_row(row) if row else None
+
+    def max_note_id(self):
+        # Базы, созданные до counters, - по самим заметкам
+        return self.connection.execute(
+            "SELECT MAX(COALESCE((SELECT value FROM counters WHERE name = 'last_note_id'), 0), "
+            "COALESCE((SELECT MAX(id) FROM notes), 0))"
+        ).fetchone()[0]
+
+    def append(self, record):
+        """Применение одной записи изменения в отдельной транзакции."""
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Применение набора записей одной транзакцией."""
+        with self.connection:
+            for record in records:
+                self._apply(record)
+
+    def _apply(self, record):
+        """Применение одной записи изменения."""
+        op = record["op"]
+        technique = record.get("technique")
+        if op == "add_technique":
+            self.connection.execute("INSERT OR IGNORE INTO techniques (name) VALUES (?)", (technique,))
+        elif op == "delete_technique":
+            self.connection.execute("DELETE FROM notes WHERE technique = ?", (technique,))
+            self.connection.execute("DELETE FROM day_totals WHERE technique = ?", (technique,))
+            self.connection.execute("DELETE FROM techniques WHERE name = ?", (technique,))
+        elif op == "add_note":
+            note = record["note"]
+            self.connection.execute(
+                "INSERT INTO notes (id, technique, date, description, work_time) VALUES (?, ?, ?, ?, ?)",
+                (note.get("id"), technique, note["date"], note["description"], note["work_time"])
+            )
+        elif op == "edit_note":
+            fields = [field for field in NOTE_FIELDS if field in record["fields"]]
+            self.connection.execute(
+                f"UPDATE notes SET {', '.join(f'{field} = ?' for field in fields)} WHERE id = ?",
+                [record["fields"][field] for field in fields] + [record["id"]]
+            )
+        elif op == "delete_note":
+            self.connection.execute("DELETE FROM notes WHERE id = ?", (record["id"],))
+        elif op == "sync":
+            # uid и версии после обмена, снятие отметок отправленного и полученного
+            self.connection.executemany(
+                "DELETE FROM sync_notes WHERE id = ?",
+                [(note_id,) for note_id, entry in record["notes"] if not entry]
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO sync_notes (id, uid, counter, device, technique) VALUES (?, ?, ?, ?, ?)",
+                [[note_id] + entry for note_id, entry in record["notes"] if entry]
+            )
+            if "done" in record:
+                self.connection.execute("DELETE FROM sync_changes WHERE seq <= ?", (record["done"],))
+            self.connection.executemany(
+                "DELETE FROM sync_changes WHERE id = ?", [(note_id,) for note_id in record.get("received", ())]
+            )
+
+    def count_notes(self):
+        return self.connection.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def iter_notes(self):
+        """Все заметки по одной: (техника, заметка), без загрузки всей таблицы."""
+        rows = self.connection.execute(f"SELECT technique, {NOTE_COLUMNS} FROM notes ORDER BY id")
+        for row in rows:
+            yield row[0], note_from_row(row[1:])
+
+    def sync_changes(self):
+        """Заметки, измененные после синхронизации: (номер отметки, id, техника, заметка).
+
+        У удаленной заметки техника и заметка - None.
+        """
+        rows = self.connection.execute(
+            "SELECT sync_changes.seq, sync_changes.id, notes.technique, notes.date, notes.description, "
+            "notes.work_time FROM sync_changes LEFT JOIN notes ON notes.id = sync_changes.id "
+            "ORDER BY sync_changes.seq"
+        )
+        return [
+            (seq, note_id, technique, None if technique is None else note_from_row((note_id, *row)))
+            for seq, note_id, technique, *row in rows
+        ]
+
+    def sync_entries(self, note_ids=(), uids=(), technique=None):
+        """uid и версии заметок: id -> [uid, счетчик, устройство, техника].
+
+        Отбираются заметки с id из note_ids, с uid из uids и все заметки техники technique.
+        """
+        queries = []
+        for column, values in (("id", list(note_ids)), ("uid", list(uids))):
+            for start in range(0, len(values), SQL_VARIABLES):
+                chunk = values[start:start + SQL_VARIABLES]
+                queries.append((f"{column} IN ({', '.join('?' * len(chunk))})", chunk))
+        if technique is not None:
+            queries.append(("technique = ?", [technique]))
+        entries = {}
+        for condition, values in queries:
+            rows = self.connection.execute(
+                f"SELECT id, uid, counter, device, technique FROM sync_notes WHERE {condition}", values
+            )
+            for note_id, *entry in rows:
+                entries[note_id] = entry
+        return entries
+
+    def replace(self, data):
+        """Полная замена содержимого базы одной транзакцией."""
+        self.replace_stream(data["techniques"], iter_data_notes(data))
+
+    def replace_stream(self, techniques, notes):
+        """Полная замена содержимого базы из потока (техника, заметка) одной транзакцией."""
+        with self.connection:
+            self.connection.execute("DELETE FROM notes")
+            self.connection.execute("DELETE FROM day_totals")
+            self.connection.execute("DELETE FROM techniques")
+            self.connection.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('migrated', 1)")
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO techniques (name) VALUES (?)",
+                [(technique,) for technique in techniques]
+            )
+            # Заметки без id получают его от SQLite
+            self.connection.executemany(
+                "INSERT INTO notes (id, technique, date, description, work_time) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (note.get("id"), technique, note["date"], note["description"], note["work_time"])
+                    for technique, note in notes
+                )
+            )
+
+    def query_notes(self, technique, date_from=None, date_to=None):
+        """Заметки техники за период (даты включительно)."""
+        rows = self.connection.execute(
+            f"SELECT {NOTE_COLUMNS} FROM notes "
+            "WHERE technique = ? AND date >= ? AND date <= ? ORDER BY date, id",
+            (technique, date_from or "", date_to or "9999")
+        )
+        return [note_from_row(row) for row in rows]
+
+    def page_notes(self, technique, before, limit):
+        """Страница заметок техники от новых к старым, старше курсора before = (дата, id).
+
+        Индекс (техника, дата) содержит и id, поэтому SQLite читает только строки страницы,
+        сколько бы заметок ни было у техники.
+        """
+        if before:
+            date, note_id = before
+            rows = self.connection.execute(
+                f"SELECT {NOTE_COLUMNS} FROM notes "
+                "WHERE technique = ? AND date <= ? AND (date < ? OR id < ?) "
+                "ORDER BY date DESC, id DESC LIMIT ?",
+                (technique, date, date, note_id, limit)
+            )
+        else:
+            rows = self.connection.execute(
+                f"SELECT {NOTE_COLUMNS} FROM notes WHERE technique = ? ORDER BY date DESC, id DESC LIMIT ?",
+                (technique, limit)
+            )
+        return [note_from_row(row) for row in rows]
+
+    def iter_rows(self, techniques=None, date_from=None, date_to=None):
+        """Строки (техника, id, дата, описание, секунды) по технике, затем по дате.
+
+        Условия выполняет SQLite по индексу (технике, дате), строки читаются по мере записи.
+        """
+        if techniques is None:
+            techniques = [name for (name,) in self.connection.execute("SELECT name FROM techniques ORDER BY id")]
+        for technique in techniques:
+            yield from self.connection.execute(
+                f"SELECT technique, {NOTE_COLUMNS} FROM notes "
+                "WHERE technique = ? AND date >= ? AND date <= ? ORDER BY date, id",
+                (technique, date_from or "", date_to or "9999")
+            )
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.connection.close()
+
+
+_FLUSH = object()  # Записать накопленное сразу, не дожидаясь WRITE_DELAY
+_STOP = object()  # Завершить поток записи
+
+
+class BackgroundStorage:
+    """Хранилище, которое пишет изменения в отдельном потоке.
+
+    append() только ставит запись в очередь. Поток записи собирает изменения,
+    пришедшие за WRITE_DELAY секунд, и записывает их одним append_many.
+    Чтение сначала дожидается записи всего накопленного.
+    Не записанные из-за ошибки изменения остаются и пишутся снова вместе со следующими,
+    а flush() и close() до успешной записи поднимают эту ошибку.
+    """
+
+    def __init__(self, storage, delay=WRITE_DELAY):
+        self.storage = storage
+        self.is_new = storage.is_new
+        self.delay = delay
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()  # Доступ к storage только под блокировкой
+        self.failed = []  # Изменения, которые не удалось записать
+        self.error = None  # Ошибка последней записи
+        self.thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """Поток записи."""
+        while True:
+            item = self.queue.get()
+            batch = []
+            taken = 1
+            # Собираем изменения, пока идут подряд, но не дольше delay
+            deadline = time.monotonic() + self.delay
+            while item is not _FLUSH and item is not _STOP:
+                batch.append(item)
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                taken += 1
+            if batch or self.failed:
+                batch = self.failed + batch
+                try:
+                    with self.lock, profiling.measure("storage.write"):
+                        self.storage.append_many(batch)
+                    profiling.count("storage.records", len(batch))
+                    self.failed = []
+                    self.error = None
+                except Exception as error:
+                    print(f"Ошибка записи данных: {error}")
+                    self.failed = batch
+                    self.error = error
+            for _ in range(taken):
+                self.queue.task_done()
+            if item is _STOP:
+                break
+
+    def append(self, record):
+        self.queue.put(record)
+
+    def append_many(self, records):
+        for record in records:
+            self.queue.put(record)
+
+    def _wait(self):
+        """Ожидание записи всех изменений из очереди."""
+        if self.thread.is_alive():
+            self.queue.put(_FLUSH)
+            self.queue.join()
+
+    def flush(self):
+        """Ожидание записи всех изменений, ошибка записи поднимается здесь."""
+        self._wait()
+        if self.error:
+            raise self.error
+
+    def close(self):
+        """Запись накопленного, остановка потока и закрытие хранилища."""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+        try:
+            if self.error:
+                raise self.error
+        finally:
+            self.storage.close()
+
+    def _read(self, name, *args):
+        """Чтение из хранилища после записи накопленных изменений."""
+        self._wait()
+        with self.lock:
+            return getattr(self.storage, name)(*args)
+
+    def load_index(self):
+        return self._read("load_index")
+
+    def load_notes(self, technique):
+        return self._read("load_notes", technique)
+
+    def query_notes(self, technique, date_from=None, date_to=None):
+        return self._read("query_notes", technique, date_from, date_to)
+
+    def get_note(self, technique, note_id):
+        return self._read("get_note", technique, note_id)
+
+    def page_notes(self, technique, before, limit):
+        return self._read("page_notes", technique, before, limit)
+
+    def count_notes(self):
+        return self._read("count_notes")
+
+    def max_note_id(self):
+        return self._read("max_note_id")
+
+    def iter_notes(self):
+        self._wait()
+        with self.lock:
+            yield from self.storage.iter_notes()
+
+    def iter_rows(self, techniques=None, date_from=None, date_to=None):
+        self._wait()
+        with self.lock:
+            yield from self.storage.iter_rows(techniques, date_from, date_to)
+
+    def sync_changes(self):
+        return self._read("sync_changes")
+
+    def sync_entries(self, note_ids=(), uids=(), technique=None):
+        return self._read("sync_entries", note_ids, uids, technique)
+
+    def replace(self, data):
+        self._read("replace", data)
+
+    def replace_stream(self, techniques, notes):
+        self._read("replace_stream", techniques, notes)
+
+
+STORAGE_KINDS = ("sqlite", "journal", "binary")
+
+
+def open_storage(data_dir, kind="sqlite", background=False, read_only=False):
+    """Создание хранилища выбранного типа.
+
+    read_only=True - только чтение уже существующих данных (нет данных - FileNotFoundError).
+    """
+    if kind not in STORAGE_KINDS:
+        raise ValueError(f"Неизвестный тип хранилища: {kind}")
+    if read_only:
+        names = ("data.db",) if kind == "sqlite" else ("data.json", "data.snap", "data.journal")
+        if not any(os.path.exists(os.path.join(data_dir, name)) for name in names):
+            raise FileNotFoundError(f"Нет данных хранилища {kind} в папке {data_dir}")
+    if kind == "sqlite":
+        storage = SqliteStorage(os.path.join(data_dir, "data.db"), read_only)
+    else:
+        storage = JournalStorage(data_dir, binary=kind == "binary", read_only=read_only)
+    if background:
+        storage = BackgroundStorage(storage)
+    return storage
+
+
+# Перенос данных из старых форматов
+
+# Форматы строк старых файлов заметок: разделитель и порядок полей
+LEGACY_DIALECTS = {
+    "main_2": ("|", ("date", "start_time", "end_time", "description", "work_time")),
+    "main_3": ("|", ("date", "description", "start_time", "end_time", "work_time")),
+    "main_4": (";", ("date", "description", "start_time", "end_time", "work_time")),
+    "main_5": (";", ("date", "description", "work_time")),
+    "short|": ("|", ("date", "description", "work_time")),
+    "main_2;": (";", ("date", "start_time", "end_time", "description", "work_time")),
+}
+DIALECT_SAMPLE = 50  # Сколько строк файла смотреть при определении формата
+
+
+def line_dialect(line):
+    """Формат, на который похожа одна строка, или None."""
+    separator = "|" if "|" in line else ";"
+    fields = line.rstrip("\n").split(separator)
+    for name, (dialect_separator, layout) in LEGACY_DIALECTS.items():
+        if dialect_separator != separator or len(fields) != len(layout):
+            continue
+        if all(_is_time(field) for field, key in zip(fields, layout) if key in ("start_time", "end_time")):
+            return name
+    return None
+
+
+def detect_dialect(lines):
+    """Формат файла: чаще всего встречающийся формат первых строк."""
+    votes = {}
+    for line in lines[:DIALECT_SAMPLE]:
+        name = line_dialect(line)
+        if name:
+            votes[name] = votes.get(name, 0) + 1
+    return max(votes, key=votes.get) if votes else None
+
+
+def parse_dialect_line(line, dialect):
+    """Разбор строки в известном формате. Возвращает (заметка, None) или (None, причина)."""
+    separator, layout = LEGACY_DIALECTS[dialect]
+    fields = line.rstrip("\n").split(separator)
+    if len(fields) < len(layout):
+        return None, f"полей {len(fields)} вместо {len(layout)}"
+    # Разделитель внутри описания - лишние поля относятся к описанию
+    position = layout.index("description")
+    extra = len(fields) - len(layout)
+    fields[position:position + extra + 1] = [separator.join(fields[position:position + extra + 1])]
+    values = dict(zip(layout, fields))
+    for key in ("start_time", "end_time"):
+        if key in values and not _is_time(values[key]):
+            return None, f"неверное время: {values[key]}"
+    try:
+        work_time = int(values["work_time"])
+    except ValueError:
+        return None, f"неверное время работы: {values['work_time']}"
+    if not values["date"]:
+        return None, "нет даты"
+    return {"date": values["date"], "description": values["description"], "work_time": work_time}, None
+
+
+def _is_time(text):
+    """Похоже ли поле на время ЧЧ:ММ."""
+    return len(text) == 5 and text[2] == ":" and text[:2].isdigit() and text[3:].isdigit()
+
+
+def parse_legacy_file(path):
+    """Разбор файла заметок целиком в одном формате.
+
+    Возвращает (формат, заметки, испорченные строки [(номер, строка, причина)]).
+    Функция верхнего уровня - её можно выполнять в отдельном процессе.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        lines = [line for line in file.read().splitlines() if line.strip()]
+    dialect = detect_dialect(lines)
+    notes = []
+    malformed = []
+    for number, line in enumerate(lines, 1):
+        if dialect is None:
+            malformed.append((number, line, "формат файла не определен"))
+            continue
+        note, reason = parse_dialect_line(line, dialect)
+        if note:
+            notes.append(note)
+        else:
+            malformed.append((number, line, reason))
+    return dialect, notes, malformed
+
+
+def scan_legacy(legacy_dir, processes=1, include_unlisted=False):
+    """Чтение techniques.txt и файлов заметок <техника>.txt.
+
+    processes > 1 (или None - по числу процессоров) - файлы разбираются параллельно.
+    include_unlisted=True - добавляются и файлы .txt техники, которой нет в techniques.txt.
+    Возвращает (данные в формате data.json, {техника: {"file", "dialect", "notes", "malformed"}}).
+    """
+    data = empty_data()
+    report = {}
+    techniques_path = os.path.join(legacy_dir, "techniques.txt")
+    if os.path.exists(techniques_path):
+        with open(techniques_path, "r", encoding="utf-8") as file:
+            data["techniques"] = [line.strip() for line in file if line.strip()]
+    elif not include_unlisted:
+        return data, report
+    # Файлы писались под Windows, где регистр имени не важен (Champion -> champion.txt)
+    files = {name.lower(): name for name in os.listdir(legacy_dir) if name.lower().endswith(".txt")}
+    listed = {f"{technique}.txt".lower() for technique in data["techniques"]}
+    unlisted = set()
+    if include_unlisted:
+        for lower_name, file_name in sorted(files.items()):
+            if lower_name != "techniques.txt" and lower_name not in listed:
+                data["techniques"].append(file_name[:-4])
+                unlisted.add(file_name[:-4])
+    paths = {}
+    for technique in data["techniques"]:
+        data["notes"][technique] = []
+        file_name = files.get(f"{technique}.txt".lower())
+        if file_name:
+            paths[technique] = os.path.join(legacy_dir, file_name)
+
+    if processes != 1 and len(paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(processes) as executor:
+            results = list(executor.map(parse_legacy_file, paths.values()))
+    else:
+        results = [parse_legacy_file(path) for path in paths.values()]
+    for (technique, path), (dialect, notes, malformed) in zip(paths.items(), results):
+        if technique in unlisted and dialect is None:
+            # Посторонний .txt, а не файл заметок
+            data["techniques"].remove(technique)
+            del data["notes"][technique]
+            continue
+        data["notes"][technique] = notes
+        report[technique] = {"file": path, "dialect": dialect, "notes": len(notes), "malformed": malformed}
+    return data, report
+
+
+def read_legacy(legacy_dir):
+    """Чтение techniques.txt и файлов заметок <техника>.txt."""
+    return scan_legacy(legacy_dir)[0]
+
+
+def load_legacy(storage, legacy_dir, processes=None, include_unlisted=True):
+    """Перенос старых .txt в уже работающее хранилище одной записью (одной транзакцией SQLite).
+
+    Техника, которая уже есть в хранилище, пропускается, поэтому повторный перенос
+    ничего не удваивает. Возвращает отчет scan_legacy с отметкой "skipped".
+    """
+    data, report = scan_legacy(legacy_dir, processes, include_unlisted)
+    existing = set(storage.load_index()["techniques"])
+    next_id = storage.max_note_id() + 1
+    records = []
+    for technique in data["techniques"]:
+        if technique in existing:
+            if technique in report:
+                report[technique]["skipped"] = True
+            continue
+        existing.add(technique)
+        records.append({"op": "add_technique", "technique": technique})
+        for note in data["notes"][technique]:
+            note["id"] = next_id
+            next_id += 1
+            records.append({"op": "add_note", "technique": technique, "note": note})
+    storage.append_many(records)
+    storage.flush()
+    return report
+
+
+def migrate(storage, data_dir, legacy_dir="."):
+    """Однократный перенос data.json (с журналом) и старых .txt в хранилище.
+
+    Техника из data.json имеет приоритет: старые .txt дописывали туда же.
+    """
+    data = JournalStorage(data_dir).load()
+    legacy = read_legacy(legacy_dir)
+    for technique in legacy["techniques"]:
+        if technique not in data["notes"]:
+            data["techniques"].append(technique)
+            data["notes"][technique] = legacy["notes"][technique]
+    storage.replace(data)
@@ -0,0 +1,344 @@
+# Синхронизация данных нескольких телефонов через сервер в локальной сети.
+#
+# Сервер (на ноутбуке): python sync.py serve [--port 8765] [--db sync.db]
+# Телефон отправляет только изменения после прошлой синхронизации и получает
+# только записи, изменившиеся на сервере после неё.
+#
+# У каждой записи (техники или заметки) есть постоянный uid, общий для всех устройств,
+# и версия [счетчик, устройство]. Счетчик - часы Лампорта: больше любого уже виденного.
+# Из двух версий одной записи побеждает большая (сначала по счетчику, затем по устройству),
+# поэтому все устройства приходят к одному результату независимо от порядка синхронизаций.
+#
+# Что изменилось на телефоне, отмечает само хранилище при каждом изменении заметки,
+# там же хранятся uid и версия каждой заметки (см. storage.py). Синхронизация читает
+# и записывает только отмеченные заметки, в sync.json - лишь часы, сервер и техника.
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import uuid
+import zlib
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import Request, urlopen
+from ledger import Note
+from storage import atomic_open
+
+PORT = 8765
+TIMEOUT = 30  # Ожидание ответа сервера, секунды
+
+
+def content_hash(technique, note):
+    """Контрольная сумма содержимого заметки: техника, дата, описание, время работы."""
+    text = "\x1f".join((technique, note["date"], note["description"], str(note["work_time"])))
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class SyncClient:
+    """Состояние синхронизации одного устройства (data_dir/sync.json)."""
+
+    def __init__(self, data_dir):
+        self.path = os.path.join(data_dir, "sync.json")
+        self.device = uuid.uuid4().hex  # Постоянный номер устройства
+        self.server = ""  # Адрес сервера, например http://192.168.0.10:8765
+        self.clock = 0  # Часы Лампорта
+        self.server_seq = 0  # Номер последнего полученного изменения на сервере
+        self.techniques = {}  # техника -> [счетчик, устройство, удалена]
+        # Заметки из sync.json прежней версии: переносятся в хранилище при синхронизации
+        self.legacy_notes = {}  # id заметки -> [uid, счетчик, устройство, сумма, техника]
+        # Во время apply: id заметки -> [uid, счетчик, устройство, техника] (None - забыть),
+        # uid -> id заметки и что из этого записать в хранилище
+        self.notes = {}
+        self.uids = {}
+        self.updated = {}
+        self.received = []
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as file:
+                state = json.load(file)
+            self.device = state["device"]
+            self.server = state.get("server", "")
+            self.clock = state["clock"]
+            self.server_seq = state["server_seq"]
+            self.techniques = state["techniques"]
+            self.legacy_notes = {int(note_id): entry for note_id, entry in state.get("notes", {}).items()}
+
+    def save(self):
+        state = {
+            "device": self.device,
+            "server": self.server,
+            "clock": self.clock,
+            "server_seq": self.server_seq,
+            "techniques": self.techniques,
+        }
+        with atomic_open(self.path) as file:
+            json.dump(state, file, ensure_ascii=False)
+
+    def _version(self):
+        self.clock += 1
+        return [self.clock, self.device]
+
+    def local_changes(self, storage, techniques):
+        """Изменения на устройстве после прошлой синхронизации.
+
+        Из хранилища читаются только отмеченные заметки, Ledger не используется - можно в потоке.
+        techniques - список техники на устройстве.
+        Возвращает (изменения для сервера, новое состояние для apply).
+        Состояние применяется в apply только после ответа сервера.
+        """
+        changes = []
+        new_techniques = dict(self.techniques)
+        for technique in techniques:
+            known = new_techniques.get(technique)
+            if known is None or known[2]:
+                version = self._version()
+                new_techniques[technique] = version + [False]
+                changes.append({"uid": f"technique:{technique}", "kind": "technique", "technique": technique,
+                                "version": version})
+        for technique, known in self.techniques.items():
+            if not known[2] and technique not in techniques:
+                version = self._version()
+                new_techniques[technique] = version + [True]
+                changes.append({"uid": f"technique:{technique}", "kind": "technique", "technique": technique,
+                                "deleted": True, "version": version})
+
+        if self.legacy_notes:
+            # Первая синхронизация после sync.json с заметками: их uid и версии - в хранилище
+            storage.append({"op": "sync", "notes": [
+                [note_id, [uid, counter, device, technique]]
+                for note_id, (uid, counter, device, _, technique) in self.legacy_notes.items()
+            ]})
+        marked = storage.sync_changes()
+        done = max((seq for seq, _, _, _ in marked), default=-1)
+        rows = [(note_id, technique, note) for _, note_id, technique, note in marked]
+        if self.legacy_notes:
+            # До первой синхронизации отмечены все заметки, остальные из sync.json удалены
+            ids = {note_id for note_id, _, _ in rows}
+            rows += [(note_id, None, None) for note_id in self.legacy_notes if note_id not in ids]
+        entries = storage.sync_entries(note_ids=[note_id for note_id, _, _ in rows])
+        notes = {}  # id заметки -> новое состояние, None - удалена
+        for note_id, technique, note in rows:
+            entry = entries.get(note_id)
+            if note is None:
+                if entry:
+                    changes.append({"uid": entry[0], "kind": "note", "deleted": True, "version": self._version()})
+                    notes[note_id] = None
+                continue
+            legacy = self.legacy_notes.get(note_id)
+            if legacy and legacy[3] == content_hash(technique, note):
+                continue  # Отмечена при переходе, но не менялась после синхронизации
+            uid = entry[0] if entry else f"{self.device}:{note_id}"
+            version = self._version()
+            notes[note_id] = [uid] + version + [technique]
+            changes.append({
+                "uid": uid, "kind": "note", "technique": technique, "version": version,
+                "note": {field: note[field] for field in ("date", "description", "work_time")},
+            })
+        return changes, (new_techniques, notes, done)
+
+    def exchange(self, changes, url=None):
+        """Отправка изменений и получение новых с сервера. Ledger не используется - можно в потоке."""
+        body = json.dumps({"device": self.device, "since": self.server_seq, "changes": changes}).encode("utf-8")
+        request = Request(
+            (url or self.server).rstrip("/") + "/sync", data=body,
+            headers={"Content-Type": "application/json"}
+        )
+        with urlopen(request, timeout=TIMEOUT) as response:
+            return json.loads(response.read())
+
+    def apply(self, ledger, state, response):
+        """Учет отправленных изменений и применение полученных. Возвращает число полученных."""
+        self.techniques, sent, done = state
+        uids = [change["uid"] for change in response["changes"] if change["kind"] == "note"]
+        self.notes = ledger.storage.sync_entries(uids=uids) if uids else {}
+        self.notes.update(sent)
+        self.uids = {entry[0]: note_id for note_id, entry in self.notes.items() if entry}
+        self.updated = dict(sent)
+        self.received = []
+        added = []  # (техника, заметка, uid, версия)
+        for change in response["changes"]:
+            self.clock = max(self.clock, change["version"][0])
+            if change["kind"] == "technique":
+                self._add_notes(ledger, added)  # Новые заметки - до возможного удаления их техники
+                self._apply_technique(ledger, change)
+            else:
+                self._apply_note(ledger, change, added)
+        self._add_notes(ledger, added)
+        # После изменений заметок, чтобы снять и их отметки: они пришли с сервера
+        ledger.storage.append({
+            "op": "sync", "notes": [[note_id, entry] for note_id, entry in self.updated.items()],
+            "done": done, "received": self.received,
+        })
+        self.server_seq = response["seq"]
+        self.legacy_notes = {}
+        self.save()
+        return len(response["changes"])
+
+    def _add_notes(self, ledger, added):
+        """Добавление накопленных новых заметок одной записью в хранилище."""
+        if added:
+            ledger.add_batch((technique, note) for technique, note, _, _ in added)
+            for technique, note, uid, version in added:
+                self._remember(note.id, uid, version, technique)
+            added.clear()
+
+    def _apply_technique(self, ledger, change):
+        technique = change["technique"]
+        known = self.techniques.get(technique)
+        if known and change["version"] <= known[:2]:
+            return
+        deleted = change.get("deleted", False)
+        self.techniques[technique] = change["version"] + [deleted]
+        if deleted:
+            if technique in ledger.totals:
+                ledger.delete_technique(technique)
+            # Удаление заметок придет от устройства, удалившего технику
+            entries = ledger.storage.sync_entries(technique=technique)
+            entries.update(self.notes)
+            for note_id, entry in entries.items():
+                if entry and entry[3] == technique:
+                    self._forget(note_id, entry[0])
+        else:
+            ledger.add_technique(technique)
+
+    def _apply_note(self, ledger, change, added):
+        uid = change["uid"]
+        note_id = self.uids.get(uid)
+        entry = self.notes.get(note_id)
+        if entry and change["version"] <= entry[1:3]:
+            return  # На устройстве версия не старше
+        if entry:
+            # Удаление или изменение заметки, которая есть на устройстве
+            technique = entry[3]
+            notes = ledger.technique_notes(technique)
+            if note_id not in notes:
+                return  # Удалена на устройстве во время обмена, удаление уйдет следующей синхронизацией
+            note = notes.get(note_id)
+            data = change.get("note")
+            if data and change["technique"] == technique and (data["date"], data["description"]) == \
+                    (note.date, note.description):
+                ledger.edit_note(technique, note_id, timedelta(seconds=data["work_time"]))
+                self._remember(note_id, uid, change["version"], technique)
+                return
+            ledger.delete_note(technique, note_id)
+            self._forget(note_id, uid)
+        if change.get("deleted"):
+            return
+        technique = change["technique"]
+        if technique not in ledger.totals:
+            ledger.add_technique(technique)
+        data = change["note"]
+        added.append((technique, Note(data["date"], data["description"], timedelta(seconds=data["work_time"])),
+                      uid, change["version"]))
+
+    def _remember(self, note_id, uid, version, technique):
+        """Заметка получена с сервера: ее отметку снимает запись "sync"."""
+        self.notes[note_id] = self.updated[note_id] = [uid] + list(version) + [technique]
+        self.uids[uid] = note_id
+        self.received.append(note_id)
+
+    def _forget(self, note_id, uid):
+        self.notes[note_id] = self.updated[note_id] = None
+        self.uids.pop(uid, None)
+
+    def sync(self, ledger, url=None):
+        """Полная синхронизация. Возвращает (отправлено, получено)."""
+        if url:
+            self.server = url
+        changes, state = self.local_changes(ledger.storage, ledger.techniques)
+        response = self.exchange(changes)
+        return len(changes), self.apply(ledger, state, response)
+
+
+SERVER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    uid TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    counter INTEGER NOT NULL,
+    device TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_seq ON records (seq);
+"""
+
+
+class SyncServer:
+    """Хранилище сервера: последняя версия каждой записи и номер изменения (seq)."""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SERVER_SCHEMA)
+        self.lock = threading.Lock()
+
+    def exchange(self, request):
+        """Прием изменений устройства и выдача записей, изменившихся после since."""
+        device = request["device"]
+        with self.lock, self.connection:
+            seq = self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM records").fetchone()[0]
+            for change in request["changes"]:
+                row = self.connection.execute(
+                    "SELECT counter, device FROM records WHERE uid = ?", (change["uid"],)
+                ).fetchone()
+                if row and change["version"] <= list(row):
+                    continue  # На сервере версия новее
+                seq += 1
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO records (uid, seq, counter, device, body) VALUES (?, ?, ?, ?, ?)",
+                    (change["uid"], seq, change["version"][0], change["version"][1],
+                     json.dumps(change, ensure_ascii=False))
+                )
+            # Свои же изменения устройству не возвращаются
+            rows = self.connection.execute(
+                "SELECT body FROM records WHERE seq > ? AND device != ? ORDER BY seq",
+                (request["since"], device)
+            )
+            changes = [json.loads(body) for (body,) in rows]
+        return {"seq": seq, "changes": changes}
+
+    def close(self):
+        self.connection.close()
+
+
+def serve(port=PORT, db_path="sync.db"):
+    """Запуск сервера синхронизации."""
+    server_data = SyncServer(db_path)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/sync":
+                self.send_error(404)
+                return
+            try:
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                body = json.dumps(server_data.exchange(request), ensure_ascii=False).encode("utf-8")
+            except (ValueError, KeyError, TypeError) as error:
+                self.send_error(400, str(error))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer(("", port), Handler)
+    print(f"Сервер синхронизации: порт {port}, данные {db_path}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        server_data.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер синхронизации учета работы техники")
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--db", default="sync.db", help="Файл данных сервера")
+    args = parser.parse_args()
+    serve(args.port, args.db)
+
+
+if __name__ == "__main__":
+    main()
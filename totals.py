@@ -0,0 +1,66 @@
+# Накопленные итоги времени работы по технике.
+# Итоги обновляются при каждом изменении заметки, а не пересчитываются по всему списку,
+# поэтому отчет за любой период строится по числу периодов, а не заметок.
+from datetime import datetime
+from functools import lru_cache
+
+PERIODS = ("day", "week", "month", "year")
+
+
+def format_duration(seconds):
+    """Время работы в виде ЧЧ:ММ, часы не ограничены сутками."""
+    minutes = int(seconds) // 60
+    return f"{minutes // 60:02}:{minutes % 60:02}"
+
+
+@lru_cache(maxsize=4096)
+def period_keys(date):
+    """Ключи дня, недели ISO, месяца и года для даты "ГГГГ-ММ-ДД"."""
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        return date, date, date[:7], date[:4]  # Дата в неизвестном формате - как есть
+    year, week, _ = day.isocalendar()
+    return day.strftime("%Y-%m-%d"), f"{year}-W{week:02}", day.strftime("%Y-%m"), day.strftime("%Y")
+
+
+class TechniqueTotals:
+    def __init__(self):
+        self.total = 0  # Общее время работы, секунды
+        self.by_day = {}  # "ГГГГ-ММ-ДД" -> секунды
+        self.by_week = {}  # "ГГГГ-Wнн" (неделя ISO) -> секунды
+        self.by_month = {}  # "ГГГГ-ММ" -> секунды
+        self.by_year = {}  # "ГГГГ" -> секунды
+
+    def _buckets(self, date):
+        return zip((self.by_day, self.by_week, self.by_month, self.by_year), period_keys(date))
+
+    def add(self, date, seconds):
+        """Учет времени работы заметки."""
+        self.total += seconds
+        for buckets, key in self._buckets(date):
+            buckets[key] = buckets.get(key, 0) + seconds
+
+    def remove(self, date, seconds):
+        """Исключение времени работы заметки."""
+        self.total -= seconds
+        for buckets, key in self._buckets(date):
+            left = buckets.get(key, 0) - seconds
+            if left:
+                buckets[key] = left
+            else:
+                buckets.pop(key, None)
+
+    def by_period(self, period):
+        """Итоги за период: "day", "week", "month" или "year"."""
+        if period not in PERIODS:
+            raise ValueError(f"Неизвестный период: {period}")
+        return getattr(self, f"by_{period}")
+
+    def day(self, date):
+        """Время работы за день."""
+        return self.by_day.get(period_keys(date)[0], 0)
+
+    def month(self, month):
+        """Время работы за месяц ("ГГГГ-ММ")."""
+        return self.by_month.get(month, 0)